@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from Schemas.userSchema import UserCreate, UserLogin
-from Database.database import get_db
+from Database.database import get_async_db
 from Services.user_service import create_user, authenticate_user
 from Services.auth_service import create_access_token
 
@@ -11,9 +11,9 @@ router = APIRouter(
 )
 
 @router.post("/register")
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # pydantic will validate email/password thanks to our schema
-    new_user = create_user(user, db)
+    new_user = await create_user(user, db)
 
     # Create token immediately — same shape as /login
     # so auth-context.tsx handles both identically
@@ -31,8 +31,8 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
     }
 
 @router.post("/login")
-def login_user(credentials: UserLogin, db: Session = Depends(get_db)):
-    user = authenticate_user(credentials.email, credentials.password, db)
+async def login_user(credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(credentials.email, credentials.password, db)
     if not user:
         # use 401 so clients know authentication failed rather than bad request
         raise HTTPException(status_code=401, detail="Invalid email or password")
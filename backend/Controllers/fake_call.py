@@ -1,9 +1,14 @@
+import asyncio
 import os
 import random
+import time
 import httpx
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from dotenv import load_dotenv
+from Services.tts_cache import audio_cache, cache_key
+from Services import metrics
+from Services.app_logging import get_logger
 
 load_dotenv()
 
@@ -11,8 +16,24 @@ router = APIRouter()
 
 ELEVEN_LABS_API_KEY = os.getenv("ELEVEN_LABS_API_KEY")
 VOICE_ID = os.getenv("ELEVEN_LABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")  # Rachel
+# Point at a local fake server in tests
+ELEVEN_LABS_BASE_URL = os.getenv("ELEVEN_LABS_BASE_URL", "https://api.elevenlabs.io")
+TTS_MAX_CONNECTIONS = int(os.getenv("TTS_MAX_CONNECTIONS", "20"))
+MODEL_ID = "eleven_turbo_v2"
+VOICE_SETTINGS = {
+    "stability": 0.4,
+    "similarity_boost": 0.8,
+    "style": 0.3,
+    "use_speaker_boost": True,
+}
+# Segments rendered at once when warming the cache
+WARM_CONCURRENCY = int(os.getenv("TTS_WARM_CONCURRENCY", "4"))
 
-print(f"[FakeCall] API key loaded: {'YES' if ELEVEN_LABS_API_KEY else 'NO'}")
+# "headers": until ElevenLabs answers; "render": until the last audio byte arrives
+TTS_SECONDS = metrics.Histogram("tts_upstream_seconds", "ElevenLabs request latency", ("phase", "status"))
+
+log = get_logger("fake_call")
+log.info("ElevenLabs API key loaded" if ELEVEN_LABS_API_KEY else "ElevenLabs API key missing")
 
 # Each conversation is a list of segments
 # The frontend will request them one by one by index
@@ -45,11 +66,220 @@ CONVERSATIONS = [
 ]
 
 
-@router.post("/fake-call/audio")
-async def get_fake_call_audio(segment: int = Query(0), conversation: int = Query(-1)):
+# One pooled client for every ElevenLabs call, so connections and TLS
+# sessions are reused. Opened and closed by the app lifespan.
+_http_client: httpx.AsyncClient | None = None
+# segment key -> future resolved with the audio (or None on failure) while a
+# render is in progress, so concurrent requests and prefetches share it
+_inflight: dict[str, asyncio.Future] = {}
+_prefetch_tasks: set[asyncio.Task] = set()
+
+
+def open_tts_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            base_url=ELEVEN_LABS_BASE_URL,
+            timeout=30,
+            limits=httpx.Limits(max_connections=TTS_MAX_CONNECTIONS, max_keepalive_connections=TTS_MAX_CONNECTIONS),
+            transport=transport,
+        )
+    return _http_client
+
+
+async def close_tts_client():
+    global _http_client
+    for task in list(_prefetch_tasks):
+        task.cancel()
+    await asyncio.gather(*_prefetch_tasks, return_exceptions=True)
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def segment_key(script: str) -> str:
+    return cache_key(script, VOICE_ID, MODEL_ID, VOICE_SETTINGS)
+
+
+async def _open_upstream(script: str) -> httpx.Response:
+    """Start an ElevenLabs render and return the response with its body unread."""
     if not ELEVEN_LABS_API_KEY:
         raise HTTPException(status_code=500, detail="11Labs API key not configured")
 
+    client = open_tts_client()
+    request = client.build_request(
+        "POST",
+        f"/v1/text-to-speech/{VOICE_ID}",
+        headers={
+            "xi-api-key": ELEVEN_LABS_API_KEY,
+            "Content-Type": "application/json",
+            "Accept": "audio/mpeg",
+        },
+        json={
+            "text": script,
+            "model_id": MODEL_ID,
+            "voice_settings": VOICE_SETTINGS,
+        },
+    )
+    started = time.perf_counter()
+    response = await client.send(request, stream=True)
+    TTS_SECONDS.observe(time.perf_counter() - started, phase="headers", status=response.status_code)
+    response.extensions["tts_started"] = started
+
+    if response.status_code != 200:
+        body = await response.aread()
+        await response.aclose()
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"11Labs error: {body.decode(errors='replace')}"
+        )
+    return response
+
+
+async def synthesize(script: str) -> bytes:
+    """Render one segment with ElevenLabs."""
+    response = await _open_upstream(script)
+    try:
+        audio = await response.aread()
+        TTS_SECONDS.observe(time.perf_counter() - response.extensions["tts_started"], phase="render", status=200)
+        return audio
+    finally:
+        await response.aclose()
+
+
+def _begin_render(key: str) -> asyncio.Future:
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    return future
+
+
+def _finish_render(key: str, future: asyncio.Future, audio: bytes | None):
+    if _inflight.get(key) is future:
+        del _inflight[key]
+    if not future.done():
+        future.set_result(audio)
+
+
+async def get_segment_audio(script: str) -> tuple[str, bytes]:
+    """Return (cache key, audio) for a segment, rendering it on a cache miss."""
+    key = segment_key(script)
+    audio = await audio_cache.get(key)
+    if audio is not None:
+        return key, audio
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        audio = await asyncio.shield(pending)
+        if audio is not None:
+            return key, audio
+
+    future = _begin_render(key)
+    audio = None
+    try:
+        audio = await synthesize(script)
+        await audio_cache.put(key, audio)
+    finally:
+        _finish_render(key, future, audio)
+    return key, audio
+
+
+async def _stream_segment(script: str, key: str):
+    """Open the upstream render and return an iterator that relays its chunks.
+
+    The chunks are collected as they pass through and stored in the cache once
+    the stream completes. Errors from ElevenLabs are raised before any byte is
+    sent, so they still become normal HTTP errors.
+    """
+    future = _begin_render(key)
+    try:
+        upstream = await _open_upstream(script)
+    except BaseException:
+        _finish_render(key, future, None)
+        raise
+
+    async def relay():
+        chunks = []
+        audio = None
+        try:
+            async for chunk in upstream.aiter_bytes():
+                chunks.append(chunk)
+                yield chunk
+            audio = b"".join(chunks)
+            TTS_SECONDS.observe(time.perf_counter() - upstream.extensions["tts_started"], phase="render", status=200)
+            await audio_cache.put(key, audio)
+        finally:
+            _finish_render(key, future, audio)
+            await upstream.aclose()
+
+    return relay()
+
+
+def _prefetch(script: str):
+    """Render ``script`` in the background so the next request is a cache hit."""
+    if not ELEVEN_LABS_API_KEY or segment_key(script) in _inflight:
+        return
+
+    async def run():
+        if await audio_cache.contains(segment_key(script)):
+            return
+        try:
+            await get_segment_audio(script)
+        except HTTPException as e:
+            log.warning("prefetch failed", error=e.detail)
+
+    task = asyncio.create_task(run())
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
+
+
+async def warm_audio_cache() -> int:
+    """Pre-render every segment of every conversation that is not cached yet."""
+    scripts = [script for conv in CONVERSATIONS for script in conv]
+    limit = asyncio.Semaphore(WARM_CONCURRENCY)
+    counts = {"rendered": 0, "cached": 0, "failed": 0}
+
+    async def warm(script: str):
+        if await audio_cache.contains(segment_key(script)):
+            counts["cached"] += 1
+            return
+        async with limit:
+            try:
+                await get_segment_audio(script)
+                counts["rendered"] += 1
+            except HTTPException as e:
+                counts["failed"] += 1
+                log.warning("warm-up failed for a segment", error=e.detail)
+
+    await asyncio.gather(*(warm(s) for s in scripts))
+    log.info("audio cache warm-up done", **counts)
+    return counts["rendered"]
+
+
+def _byte_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """Parse a single ``bytes=start-end`` range; None if it can't be satisfied."""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_s, _, end_s = spec.strip().partition("-")
+    try:
+        if start_s:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+        else:
+            # suffix range: the last N bytes
+            start = size - int(end_s)
+            end = size - 1
+    except ValueError:
+        return None
+    start = max(start, 0)
+    end = min(end, size - 1)
+    if start > end:
+        return None
+    return start, end
+
+
+@router.api_route("/fake-call/audio", methods=["GET", "POST"])
+async def get_fake_call_audio(request: Request, segment: int = Query(0), conversation: int = Query(-1)):
     # Pick a random conversation on first segment, reuse same one after
     conv_index = conversation if conversation >= 0 else random.randint(0, len(CONVERSATIONS) - 1)
     conv = CONVERSATIONS[conv_index]
@@ -59,40 +289,54 @@ async def get_fake_call_audio(segment: int = Query(0), conversation: int = Query
         raise HTTPException(status_code=404, detail="No more segments")
 
     script = conv[segment]
+    key = segment_key(script)
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        response = await client.post(
-            f"https://api.elevenlabs.io/v1/text-to-speech/{VOICE_ID}",
-            headers={
-                "xi-api-key": ELEVEN_LABS_API_KEY,
-                "Content-Type": "application/json",
-                "Accept": "audio/mpeg",
-            },
-            json={
-                "text": script,
-                "model_id": "eleven_turbo_v2",
-                "voice_settings": {
-                    "stability": 0.4,
-                    "similarity_boost": 0.8,
-                    "style": 0.3,
-                    "use_speaker_boost": True,
-                },
-            },
-        )
-
-    if response.status_code != 200:
-        raise HTTPException(
-            status_code=response.status_code,
-            detail=f"11Labs error: {response.text}"
-        )
+    # speculatively render the next segment while this one plays
+    if segment + 1 < len(conv):
+        _prefetch(conv[segment + 1])
 
     # Return audio + metadata headers so frontend knows conversation index and total segments
-    return StreamingResponse(
-        iter([response.content]),
-        media_type="audio/mpeg",
-        headers={
-            "X-Conversation-Index": str(conv_index),
-            "X-Total-Segments": str(len(conv)),
-            "X-Current-Segment": str(segment),
-        }
-    )
\ No newline at end of file
+    etag = f'"{key}"'
+    headers = {
+        "X-Conversation-Index": str(conv_index),
+        "X-Total-Segments": str(len(conv)),
+        "X-Current-Segment": str(segment),
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=86400",
+    }
+
+    # the key addresses the content, so a matching ETag needs no audio at all
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    audio = await audio_cache.get(key)
+    if audio is None:
+        if not range_header and key not in _inflight:
+            # cache miss: pass the upstream audio through as it arrives
+            return StreamingResponse(await _stream_segment(script, key), media_type="audio/mpeg", headers=headers)
+        key, audio = await get_segment_audio(script)
+
+    if range_header:
+        byte_range = _byte_range(range_header, len(audio))
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{len(audio)}"
+            return Response(status_code=416, headers=headers)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(audio)}"
+        return Response(audio[start:end + 1], status_code=206, media_type="audio/mpeg", headers=headers)
+
+    return Response(audio, media_type="audio/mpeg", headers=headers)
+
+
+async def _warm_from_cli():
+    try:
+        await warm_audio_cache()
+    finally:
+        await close_tts_client()
+
+
+if __name__ == "__main__":
+    # python -m Controllers.fake_call  pre-renders every segment into the cache
+    asyncio.run(_warm_from_cli())
@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from datetime import datetime
+import json
+from Database.database import get_db, SessionLocal
+from Schemas.locationsSchema import NearbyUserResponse, LocationHistoryPage
+from Services import proximity_service, locationService, location_sessionService, trusted_contactsService
+from Services.auth_service import require_user
+
+router = APIRouter()
+
+@router.get("/locations/nearby", response_model=list[NearbyUserResponse])
+def get_nearby_users(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(500, gt=0, le=50000),
+    minutes: int = Query(15, gt=0, le=24 * 60),
+    limit: int = Query(100, gt=0, le=1000),
+    exclude_user_id: int | None = None,
+    claims: dict = Depends(require_user),
+    db: Session = Depends(get_db),
+):
+    # only users who share their location with the caller
+    return proximity_service.find_nearby(db, claims["id"], lat, lng, radius_m, minutes, limit, exclude_user_id)
+
+
+@router.get("/users/{user_id}/sessions/{session_id}/locations", response_model=LocationHistoryPage)
+def get_session_locations(
+    user_id: int,
+    session_id: int,
+    limit: int = Query(500, gt=0, le=5000),
+    cursor: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    every_s: float | None = Query(None, gt=0),
+    claims: dict = Depends(require_user),
+    db: Session = Depends(get_db),
+):
+    # the owner and their accepted contacts only; the session must be the owner's
+    trusted_contactsService.require_viewer(db, user_id, claims["id"])
+    location_sessionService.get_user_session(db, user_id, session_id)
+    return locationService.get_session_history(db, session_id, limit, cursor, start, end, every_s)
+
+
+@router.get("/users/{user_id}/sessions/{session_id}/locations/stream")
+def stream_session_locations(
+    user_id: int,
+    session_id: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    every_s: float | None = Query(None, gt=0),
+    claims: dict = Depends(require_user),
+    db: Session = Depends(get_db),
+):
+    """Whole session as newline-delimited JSON, read through a server-side cursor."""
+    trusted_contactsService.require_viewer(db, user_id, claims["id"])
+    location_sessionService.get_user_session(db, user_id, session_id)
+
+    def rows():
+        # the stream outlives the request's dependency, so it gets its own session
+        stream_db = SessionLocal()
+        try:
+            for loc in locationService.stream_session_history(stream_db, session_id, start, end, every_s):
+                yield json.dumps({
+                    "id": loc.id,
+                    "user_id": loc.user_id,
+                    "session_id": loc.session_id,
+                    "latitude": float(loc.latitude),
+                    "longitude": float(loc.longitude),
+                    "accuracy": loc.accuracy,
+                    "timestamp": loc.timestamp.isoformat(),
+                }) + "\n"
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from Database.database import get_db
 from Services import location_sessionService
@@ -18,5 +18,11 @@ def get_active_session(user_id: int, db: Session = Depends(get_db)):
     return location_sessionService.get_active_session(db, user_id)
 
 @router.get("/users/{user_id}/sessions")
-def get_all_sessions(user_id: int, db: Session = Depends(get_db)):
-    return location_sessionService.get_all_sessions(db, user_id)
\ No newline at end of file
+def get_all_sessions(
+    user_id: int,
+    limit: int | None = Query(None, gt=0, le=1000),
+    after_id: int | None = None,
+    db: Session = Depends(get_db),
+):
+    # all sessions unless the caller asks for a page
+    return location_sessionService.get_all_sessions(db, user_id, limit, after_id)
\ No newline at end of file
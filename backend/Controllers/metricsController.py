@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from Services import metrics
+
+router = APIRouter(tags=["Metrics"])
+
+@router.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,79 @@
+import hashlib
+import os
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from Services.auth_service import decode_share_token
+from track_hub import track_hub
+
+router = APIRouter(tags=["Tracking"])
+
+# Seconds between SSE keep-alive comments; below most proxy idle timeouts.
+TRACK_HEARTBEAT_S = float(os.getenv("TRACK_HEARTBEAT_S", "15"))
+# Longest a long-poll request is held open without a change.
+TRACK_POLL_TIMEOUT_S = float(os.getenv("TRACK_POLL_TIMEOUT_S", "25"))
+
+PAGE_PATH = os.path.join(os.path.dirname(__file__), "..", "tracking-page", "index.html")
+
+# the page is the same for every target (it reads the id and token from its
+# own URL), so it is read once and revalidated by ETag
+with open(PAGE_PATH, "rb") as f:
+    PAGE = f.read()
+PAGE_ETAG = '"' + hashlib.sha256(PAGE).hexdigest()[:16] + '"'
+PAGE_HEADERS = {"ETag": PAGE_ETAG, "Cache-Control": "public, max-age=300"}
+
+
+def _authorize(user_id: int, token: str | None):
+    if not token or decode_share_token(token, user_id) is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired tracking link")
+    if track_hub.full(user_id):
+        raise HTTPException(status_code=503, detail="Too many viewers, try again shortly")
+
+
+# Tracking page opened from the SMS link
+@router.get("/track/{user_id}")
+def tracking_page(user_id: int, if_none_match: str | None = Header(None)):
+    if if_none_match == PAGE_ETAG:
+        return Response(status_code=304, headers=PAGE_HEADERS)
+    return Response(PAGE, media_type="text/html; charset=utf-8", headers=PAGE_HEADERS)
+
+
+# Server-Sent Events: one "state" event per change, newest state only
+@router.get("/track/{user_id}/events")
+async def track_events(user_id: int, token: str | None = Query(None),
+                       last_event_id: str | None = Header(None)):
+    _authorize(user_id, token)
+    # a reconnecting EventSource sends the last version it saw
+    seen = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+
+    async def events():
+        # joined inside the stream, so a client gone before it starts never counts as a viewer
+        target = await track_hub.join(user_id)
+        try:
+            yield b"retry: 3000\n\n"
+            version = seen
+            while True:
+                if await target.wait(version, TRACK_HEARTBEAT_S):
+                    version = target.version
+                    yield target.frame
+                else:
+                    yield b": ping\n\n"
+        finally:
+            track_hub.leave(target)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # tell nginx-style proxies not to buffer the stream
+        "X-Accel-Buffering": "no",
+    })
+
+
+# Long-poll fallback: returns as soon as the state is newer than `since`
+@router.get("/track/{user_id}/poll")
+async def track_poll(user_id: int, token: str | None = Query(None), since: int = Query(0, ge=0)):
+    _authorize(user_id, token)
+    target = await track_hub.join(user_id)
+    try:
+        await target.wait(since, TRACK_POLL_TIMEOUT_S)
+        return Response(target.data, media_type="application/json", headers={"Cache-Control": "no-store"})
+    finally:
+        track_hub.leave(target)
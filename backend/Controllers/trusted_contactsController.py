@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from Database.database import get_db
 from Services import trusted_contactsService
-from Schemas.trusted_contactSchema import TrustedContactCreate, ContactStatus
+from Schemas.trusted_contactSchema import TrustedContactCreate, ContactStatus, ContactStatusUpdate
 
 router = APIRouter()
 
@@ -14,6 +14,10 @@ def create_contact(user_id: int, contact_data: TrustedContactCreate, db: Session
 def get_contacts(user_id: int, db: Session = Depends(get_db)):
     return trusted_contactsService.get_contacts(db, user_id)
 
+@router.put("/users/{user_id}/contacts/{contact_id}/status")
+def update_contact_status(user_id: int, contact_id: int, update: ContactStatusUpdate, db: Session = Depends(get_db)):
+    return trusted_contactsService.update_contact_status(db, user_id, contact_id, update.status)
+
 @router.delete("/users/{user_id}/contacts/{contact_id}")
 def delete_contact(user_id: int, contact_id: int, db: Session = Depends(get_db)):
     return trusted_contactsService.delete_contact(db, user_id, contact_id)
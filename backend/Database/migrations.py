@@ -0,0 +1,214 @@
+import os
+import re
+import sys
+from datetime import datetime, timezone
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from Database.database import Base
+from Services.app_logging import get_logger
+
+# Versioned schema changes. create_all() only creates missing tables, so any
+# column or index added to an existing table has to land here as well.
+# Each step checks the live schema first, which makes it a no-op on a database
+# that create_all() just built from the current models.
+
+log = get_logger("migrations")
+
+CREATE_SCRIPT = os.path.join(os.path.dirname(__file__), "..", "..", "Database init", "createScript")
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def _has_index(conn: Connection, table: str, name: str) -> bool:
+    return any(ix["name"] == name for ix in inspect(conn).get_indexes(table))
+
+
+def _create_index(conn: Connection, table: str, name: str):
+    """Create an index exactly as it is declared on the ORM model."""
+    if _has_index(conn, table, name):
+        return
+    index = next(ix for ix in Base.metadata.tables[table].indexes if ix.name == name)
+    index.create(conn)
+
+
+def _m001_locations_geohash(conn: Connection):
+    if not _has_column(conn, "locations", "geohash"):
+        # older rows keep a NULL geohash; nearby search only looks at recent points anyway
+        conn.execute(text("ALTER TABLE locations ADD COLUMN geohash VARCHAR(12)"))
+    _create_index(conn, "locations", "ix_locations_geohash_timestamp")
+
+
+def _m002_session_archives(conn: Connection):
+    Base.metadata.tables["session_archives"].create(conn, checkfirst=True)
+
+
+def _m003_hot_query_indexes(conn: Connection):
+    _create_index(conn, "location_sessions", "ix_location_sessions_user_active")
+    _create_index(conn, "locations", "ix_locations_session_timestamp")
+    _create_index(conn, "trusted_contacts", "ix_trusted_contacts_user_status")
+    _create_index(conn, "users", "ix_users_email")
+
+
+MIGRATIONS = [
+    (1, "geohash column and index on locations", _m001_locations_geohash),
+    (2, "session_archives table", _m002_session_archives),
+    (3, "indexes for session, history, recipient and login lookups", _m003_hot_query_indexes),
+]
+
+
+def current_version(conn: Connection) -> int:
+    schema_migrations.create(conn, checkfirst=True)
+    return conn.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version.desc())).scalar() or 0
+
+
+def upgrade(engine: Engine) -> int:
+    """Apply every migration newer than the recorded version; returns the new version."""
+    with engine.begin() as conn:
+        version = current_version(conn)
+
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        # one transaction per step; MySQL commits DDL implicitly anyway
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=number,
+                description=description,
+                applied_at=datetime.now(timezone.utc),
+            ))
+        log.info("migration applied", version=number, description=description)
+        version = number
+    return version
+
+
+def _model_indexes(table) -> dict[str, tuple[str, ...]]:
+    """Named secondary indexes declared on a model, ignoring the primary-key ones."""
+    pk = {c.name for c in table.primary_key.columns}
+    return {
+        ix.name: tuple(c.name for c in ix.columns)
+        for ix in table.indexes
+        if {c.name for c in ix.columns} != pk
+    }
+
+
+def _parse_create_script(path: str = CREATE_SCRIPT) -> dict[str, dict]:
+    """Columns and named indexes of every CREATE TABLE in the MySQL DDL."""
+    with open(path) as f:
+        ddl = f.read()
+
+    tables = {}
+    for name, body in re.findall(r"CREATE TABLE (\w+) \((.*?)\n\);", ddl, re.S):
+        columns, indexes = set(), {}
+        for line in body.split("\n"):
+            line = line.strip().rstrip(",")
+            if not line:
+                continue
+            index = re.match(r"INDEX (\w+) \(([^)]*)\)", line)
+            if index:
+                indexes[index.group(1)] = tuple(c.strip() for c in index.group(2).split(","))
+                continue
+            word = line.split()[0]
+            if word not in ("PRIMARY", "FOREIGN", "UNIQUE", "KEY", "CONSTRAINT", "CHECK"):
+                columns.add(word)
+        tables[name] = {"columns": columns, "indexes": indexes}
+    return tables
+
+
+def check_consistency(engine: Engine | None = None, script: str = CREATE_SCRIPT) -> list[str]:
+    """Differences between the ORM models, the createScript DDL and (optionally) a live database."""
+    problems = []
+    ddl = _parse_create_script(script)
+    live = inspect(engine) if engine is not None else None
+    live_tables = set(live.get_table_names()) if live is not None else set()
+
+    for name, table in Base.metadata.tables.items():
+        columns = {c.name for c in table.columns}
+        indexes = _model_indexes(table)
+
+        if name not in ddl:
+            problems.append(f"createScript: table {name} is missing")
+        else:
+            for col in sorted(columns ^ ddl[name]["columns"]):
+                side = "missing" if col in columns else "not in the model"
+                problems.append(f"createScript: column {name}.{col} is {side}")
+            for ix, cols in indexes.items():
+                if ddl[name]["indexes"].get(ix) != cols:
+                    problems.append(f"createScript: index {name}.{ix}{cols} is missing or different")
+
+        if live is None:
+            continue
+        if name not in live_tables:
+            problems.append(f"database: table {name} is missing")
+            continue
+        live_columns = {c["name"] for c in live.get_columns(name)}
+        for col in sorted(columns - live_columns):
+            problems.append(f"database: column {name}.{col} is missing")
+        live_indexes = {ix["name"]: tuple(ix["column_names"]) for ix in live.get_indexes(name)}
+        for ix, cols in indexes.items():
+            if live_indexes.get(ix) != cols:
+                problems.append(f"database: index {name}.{ix}{cols} is missing or different")
+    return problems
+
+
+def _hot_queries():
+    """The predicates the services run on every request, in the shape they run them."""
+    from Models.location import Location
+    from Models.location_sessions import LocationSession
+    from Models.trusted_contacts import TrustedContacts
+    from Models.user import User
+    from Services.trusted_contactsService import _recipients_query
+
+    return [
+        ("active session", "location_sessions",
+         select(LocationSession).where(LocationSession.user_id == 1, LocationSession.is_active == True)),
+        ("session list", "location_sessions",
+         select(LocationSession).where(LocationSession.user_id == 1).order_by(LocationSession.id.desc()).limit(100)),
+        ("session history", "locations",
+         select(Location).where(Location.session_id == 1).order_by(Location.timestamp, Location.id).limit(500)),
+        ("recipients", "trusted_contacts", _recipients_query(1)),
+        ("login", "users", select(User).where(User.email == "a@example.com")),
+        ("contact list", "trusted_contacts", select(TrustedContacts).where(TrustedContacts.user_id == 1)),
+    ]
+
+
+def explain_hot_queries(engine: Engine) -> list[str]:
+    """On SQLite, report every hot query whose plan scans its table instead of searching an index."""
+    if engine.dialect.name != "sqlite":
+        return []
+
+    problems = []
+    with engine.connect() as conn:
+        for name, table, stmt in _hot_queries():
+            sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = [row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql))]
+            steps = [step for step in plan if re.match(rf"(SEARCH|SCAN) {table}\b", step)]
+            if not steps or any(step.startswith("SCAN") for step in steps):
+                problems.append(f"explain: {name} does not use an index on {table}: {plan}")
+    return problems
+
+
+if __name__ == "__main__":
+    # python -m Database.migrations            apply pending migrations
+    # python -m Database.migrations --check    also verify ORM, DDL and query plans
+    from Database.database import engine
+    from Models import user, trusted_contacts, location_sessions, location, session_archive  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+    print(f"[Migrations] Schema at version {upgrade(engine)}")
+    if "--check" in sys.argv:
+        problems = check_consistency(engine) + explain_hot_queries(engine)
+        for problem in problems:
+            print(f"[Migrations] {problem}")
+        sys.exit(1 if problems else 0)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey, String, Index
 from sqlalchemy import DECIMAL
 from datetime import datetime, timezone
 from Database.database import Base
@@ -12,4 +12,12 @@ class Location(Base):
     latitude = Column(DECIMAL(9, 6), nullable=False)
     longitude = Column(DECIMAL(9, 6), nullable=False)
     accuracy = Column(Float, nullable=True)
-    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # geohash of the point, set at write time; prefix scans find nearby rows
+    geohash = Column(String(12), nullable=True)
+
+    __table_args__ = (
+        Index("ix_locations_geohash_timestamp", "geohash", "timestamp"),
+        # session history, read in (timestamp, id) order
+        Index("ix_locations_session_timestamp", "session_id", "timestamp"),
+    )
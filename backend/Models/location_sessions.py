@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float, DateTime, Enum
 from Database.database import Base
 from datetime import datetime, timezone
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, Index
 
 class LocationSession(Base):
     __tablename__ = "location_sessions"
@@ -10,4 +10,9 @@ class LocationSession(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     started_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     ended_at = Column(DateTime, nullable=True)
-    is_active = Column(Boolean, default=True)
\ No newline at end of file
+    is_active = Column(Boolean, default=True)
+
+    __table_args__ = (
+        # a user's sessions, and their active one
+        Index("ix_location_sessions_user_active", "user_id", "is_active"),
+    )
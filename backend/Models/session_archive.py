@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, LargeBinary
+from sqlalchemy.dialects import mysql
+from Database.database import Base
+from datetime import datetime, timezone
+
+class SessionArchive(Base):
+    __tablename__ = "session_archives"
+
+    session_id = Column(Integer, ForeignKey("location_sessions.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    point_count = Column(Integer, nullable=False)
+    first_timestamp = Column(DateTime, nullable=True)
+    last_timestamp = Column(DateTime, nullable=True)
+    encoding = Column(String(20), nullable=False)
+    data = Column(LargeBinary().with_variant(mysql.LONGBLOB(), "mysql"), nullable=False)
+    archived_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # set once the session's raw rows have been deleted from locations
+    raw_deleted_at = Column(DateTime, nullable=True)
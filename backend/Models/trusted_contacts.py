@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float, DateTime, Enum
 from Database.database import Base
 from datetime import datetime, timezone
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, Index
 
 class TrustedContacts(Base):
     __tablename__ = "trusted_contacts"
@@ -17,5 +17,7 @@ class TrustedContacts(Base):
     __table_args__ = (
         UniqueConstraint('user_id', 'contact_user_id', name='unique_contact'),
         UniqueConstraint('user_id', 'contact_phone', name='unqiue_phone_contact'),
-        UniqueConstraint('user_id', 'contact_email', name='unique_email_contact')
+        UniqueConstraint('user_id', 'contact_email', name='unique_email_contact'),
+        # covers the accepted-recipients lookup, including the join column
+        Index('ix_trusted_contacts_user_status', 'user_id', 'status', 'contact_user_id'),
     )
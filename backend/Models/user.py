@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from Database.database import Base
 from datetime import datetime, timezone
 
@@ -10,4 +10,9 @@ class User(Base):
     email = Column(String(100), nullable=True)
     password_hash = Column(String(255), nullable=False)
     phone = Column(String(20))
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        # login and registration look users up by email
+        Index("ix_users_email", "email"),
+    )
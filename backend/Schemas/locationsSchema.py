@@ -1,6 +1,6 @@
 
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from datetime import datetime
 
 class LocationCreate(BaseModel):
@@ -8,6 +8,21 @@ class LocationCreate(BaseModel):
     longitude: float
     accuracy: Optional[float] = None
 
+class LocationPoint(BaseModel):
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+    accuracy: Optional[float] = None
+    # when the phone took the fix: ISO 8601 or Unix time (seconds or milliseconds)
+    timestamp: datetime
+
+class LocationBatch(BaseModel):
+    points: List[LocationPoint] = Field(min_length=1, max_length=1000)
+
+class LocationBatchResult(BaseModel):
+    received: int
+    stored: int
+    session_id: Optional[int] = None
+
 class LocationResponse(BaseModel):
     id: int
     user_id: int
@@ -18,4 +33,15 @@ class LocationResponse(BaseModel):
     timestamp: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class LocationHistoryPage(BaseModel):
+    items: List[LocationResponse]
+    next_cursor: Optional[str] = None
+
+class NearbyUserResponse(BaseModel):
+    user_id: int
+    latitude: float
+    longitude: float
+    distance_m: float
+    timestamp: datetime
@@ -15,6 +15,9 @@ class TrustedContactCreate(BaseModel):
     contact_email: Optional[str] = None
     status: Optional[ContactStatus] = ContactStatus.invited
 
+class ContactStatusUpdate(BaseModel):
+    status: ContactStatus
+
 class TrustedContactResponse(BaseModel):
     id: int
     user_id: int
@@ -0,0 +1,222 @@
+import math
+import os
+import threading
+import time
+from typing import Callable, NamedTuple
+from Services import metrics
+from Services.app_logging import get_logger
+
+# Per-user token buckets for websocket messages, as "type=rate:burst" with
+# rate in messages per second. "*" covers every type not listed.
+WS_RATE_LIMITS = os.getenv(
+    "WS_RATE_LIMITS",
+    "location_update=5:10,location_batch=0.5:5,start_session=0.2:3,end_session=0.2:3,"
+    "emergency_alert=0.05:3,*=5:10",
+)
+
+# Overload thresholds. Crossing any of them turns admission control on; it
+# turns off again once every probe is below ADMIT_RECOVER_RATIO of its limit.
+ADMIT_MAX_POOL_WAIT_S = float(os.getenv("ADMIT_MAX_POOL_WAIT_S", "0.25"))
+ADMIT_MAX_WRITER_QUEUE = int(os.getenv("ADMIT_MAX_WRITER_QUEUE", "25000"))
+ADMIT_MAX_NOTIFY_QUEUE = int(os.getenv("ADMIT_MAX_NOTIFY_QUEUE", "5000"))
+ADMIT_RECOVER_RATIO = float(os.getenv("ADMIT_RECOVER_RATIO", "0.8"))
+# Half-life of the smoothed pool wait; an idle pool reads as recovered.
+POOL_WAIT_HALF_LIFE_S = float(os.getenv("ADMIT_POOL_WAIT_HALF_LIFE_S", "2"))
+# Probes are read at most this often.
+ADMIT_CHECK_INTERVAL_S = float(os.getenv("ADMIT_CHECK_INTERVAL_S", "0.25"))
+# How often buckets that have refilled completely are swept away.
+RATE_PRUNE_INTERVAL_S = float(os.getenv("WS_RATE_PRUNE_INTERVAL_S", "60"))
+
+# Dropped while overloaded; the next fix or a client retry replaces them.
+LOW_PRIORITY = frozenset({"location_update", "location_batch"})
+# Never dropped and never low priority. Past their rate limit they are still
+# handled in full; the outbox merges repeat messages to the same contact.
+NEVER_SHED = frozenset({"emergency_alert"})
+
+# close code for connections refused while overloaded ("try again later")
+OVERLOADED_CLOSE_CODE = 1013
+
+log = get_logger("admission")
+
+RATE_LIMITED = metrics.Counter("ws_rate_limited_total", "Messages over their per-user rate limit", ("type",))
+SHED = metrics.Counter("ws_shed_total", "Low-priority messages dropped while overloaded", ("type",))
+REFUSED = metrics.Counter("ws_refused_connections_total", "Websocket connections refused while overloaded")
+
+
+def _parse_limits(spec: str) -> dict[str, tuple[float, float]]:
+    limits = {}
+    for part in spec.split(","):
+        name, _, value = part.strip().partition("=")
+        rate, _, burst = value.partition(":")
+        if name and rate:
+            limits[name] = (float(rate), float(burst or rate))
+    return limits
+
+
+class _Bucket:
+    __slots__ = ("rate", "burst", "tokens", "updated", "limited")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        # set while the user is over the limit, so they are told only once
+        self.limited = False
+
+
+class Verdict(NamedTuple):
+    allowed: bool
+    # seconds until one more message of this type would be allowed
+    retry_after: float = 0.0
+    # first refusal since the user was last within the limit
+    notify: bool = False
+
+
+class RateLimiter:
+    """Token bucket per (user, message type).
+
+    Buckets are kept across reconnects until they have refilled, so closing
+    the socket and opening a new one doesn't reset a user's limits. A user
+    whose buckets are all full again is indistinguishable from a new one and
+    is swept away every ``prune_interval`` seconds.
+    """
+
+    def __init__(self, spec: str = WS_RATE_LIMITS, prune_interval: float = RATE_PRUNE_INTERVAL_S):
+        self.limits = _parse_limits(spec)
+        self.prune_interval = prune_interval
+        self._buckets: dict[int, dict[str, _Bucket]] = {}
+        self._lock = threading.Lock()
+        self._pruned = time.monotonic()
+        self.limited = 0
+
+    def acquire(self, user_id: int, kind: str) -> Verdict:
+        limit = self.limits.get(kind) or self.limits.get("*")
+        if limit is None:
+            return Verdict(True)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._pruned >= self.prune_interval:
+                self._prune(now)
+            buckets = self._buckets.setdefault(user_id, {})
+            bucket = buckets.get(kind)
+            if bucket is None:
+                bucket = buckets[kind] = _Bucket(limit[0], limit[1], now)
+            bucket.tokens = min(bucket.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                bucket.limited = False
+                return Verdict(True)
+            notify = not bucket.limited
+            bucket.limited = True
+            self.limited += 1
+        RATE_LIMITED.inc(type=kind)
+        retry_after = (1 - bucket.tokens) / bucket.rate if bucket.rate > 0 else math.inf
+        return Verdict(False, retry_after, notify)
+
+    def _prune(self, now: float):
+        # caller holds the lock
+        self._pruned = now
+        full = [
+            user_id for user_id, buckets in self._buckets.items()
+            if all(b.tokens + (now - b.updated) * b.rate >= b.burst for b in buckets.values())
+        ]
+        for user_id in full:
+            del self._buckets[user_id]
+
+    def stats(self) -> dict:
+        return {"users": len(self._buckets), "limited": self.limited}
+
+
+class _Probe(NamedTuple):
+    name: str
+    read: Callable[[], float]
+    limit: float
+
+
+class AdmissionController:
+    """Process-wide overload switch fed by queue depths and DB pool wait.
+
+    While overloaded, new sockets are refused and low-priority messages are
+    shed, so the work already admitted (and every emergency alert) still
+    gets through instead of everything slowing down together.
+    """
+
+    def __init__(self, recover_ratio: float = ADMIT_RECOVER_RATIO,
+                 check_interval: float = ADMIT_CHECK_INTERVAL_S):
+        self.recover_ratio = recover_ratio
+        self.check_interval = check_interval
+        self._probes: list[_Probe] = []
+        self._overloaded = False
+        self._checked = 0.0
+        self._wait = 0.0
+        self._wait_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.refused = 0
+        self.shed_count = 0
+
+    def add_probe(self, name: str, read: Callable[[], float], limit: float):
+        if limit > 0:
+            self._probes.append(_Probe(name, read, limit))
+
+    def record_pool_wait(self, engine: str, seconds: float):
+        """Fold one pool checkout time into the smoothed wait."""
+        with self._lock:
+            self._wait = max(seconds, self.pool_wait())
+            self._wait_at = time.monotonic()
+
+    def pool_wait(self) -> float:
+        # peak-hold that halves every POOL_WAIT_HALF_LIFE_S without new samples
+        age = time.monotonic() - self._wait_at
+        return self._wait * 0.5 ** (age / POOL_WAIT_HALF_LIFE_S)
+
+    def overloaded(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self._overloaded
+        self._checked = now
+
+        readings = [(p, p.read()) for p in self._probes]
+        if self._overloaded:
+            busy = [(p, v) for p, v in readings if v >= p.limit * self.recover_ratio]
+            if not busy:
+                self._overloaded = False
+                log.info("overload cleared")
+        else:
+            busy = [(p, v) for p, v in readings if v >= p.limit]
+            if busy:
+                self._overloaded = True
+                log.warning("overloaded, shedding low-priority work",
+                            **{p.name: round(v, 3) for p, v in busy})
+        return self._overloaded
+
+    def admit_connection(self, priority: str | None = None) -> bool:
+        """False when a new socket should be refused. An emergency never is."""
+        if priority == "emergency" or not self.overloaded():
+            return True
+        self.refused += 1
+        REFUSED.inc()
+        return False
+
+    def shed(self, kind: str) -> bool:
+        """True when a message of this type should be dropped right now."""
+        if kind not in LOW_PRIORITY or not self.overloaded():
+            return False
+        self.shed_count += 1
+        SHED.inc(type=kind)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "overloaded": int(self._overloaded),
+            "pool_wait_seconds": self.pool_wait(),
+            "refused": self.refused,
+            "shed": self.shed_count,
+        }
+
+
+rate_limiter = RateLimiter()
+admission = AdmissionController()
+admission.add_probe("db_pool_wait_s", admission.pool_wait, ADMIT_MAX_POOL_WAIT_S)
+metrics.on_pool_wait(admission.record_pool_wait)
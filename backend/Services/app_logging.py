@@ -0,0 +1,208 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Structured logging. Records are filtered (level, sampling, rate limit) in
+# the calling thread, queued, and formatted as JSON lines and written by a
+# listener thread, so the event loop never waits on stdout.
+#
+#   log = get_logger("ws")
+#   log.info("connected", user_id=7)
+#
+# Categories are the names passed to get_logger. Per-category settings:
+#   LOG_SAMPLE="ws.message=0.01,location=0.1"   keep this fraction of records
+#   LOG_RATE="ws=50,*=200"                      at most N records/second
+# WARNING and above are never sampled out, but they are still rate limited.
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "ws.message=0.01,location=0.01")
+LOG_RATE = os.getenv("LOG_RATE", "*=200")
+
+ROOT = "app"
+
+_listener: QueueListener | None = None
+_handler: "_DroppingQueueHandler | None" = None
+_lock = threading.Lock()
+
+
+def _parse(spec: str) -> dict[str, float]:
+    result = {}
+    for part in spec.split(","):
+        name, _, value = part.strip().partition("=")
+        if name and value:
+            result[name] = float(value)
+    return result
+
+
+def _lookup(settings: dict[str, float], category: str) -> float | None:
+    """Most specific setting for a category: "ws.message", then "ws", then "*"."""
+    while category:
+        if category in settings:
+            return settings[category]
+        category = category.rpartition(".")[0]
+    return settings.get("*")
+
+
+class _Bucket:
+    __slots__ = ("rate", "tokens", "updated", "suppressed")
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.suppressed = 0
+
+
+class SamplingFilter(logging.Filter):
+    """Per-category sampling and token-bucket rate limiting.
+
+    Records dropped by the rate limit are counted, and the count rides on the
+    next record that gets through as ``suppressed``.
+    """
+
+    def __init__(self, sample: dict[str, float], rate: dict[str, float]):
+        super().__init__()
+        self.sample = sample
+        self.rate = rate
+        self._buckets: dict[str, _Bucket | None] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = record.name[len(ROOT) + 1:] if record.name.startswith(ROOT + ".") else record.name
+        record.category = category
+
+        if record.levelno < logging.WARNING:
+            keep = _lookup(self.sample, category)
+            if keep is not None and keep < 1:
+                if random.random() >= keep:
+                    return False
+                record.sample_rate = keep
+
+        with self._lock:
+            if category not in self._buckets:
+                limit = _lookup(self.rate, category)
+                self._buckets[category] = _Bucket(limit) if limit else None
+            bucket = self._buckets[category]
+            if bucket is None:
+                return True
+            now = time.monotonic()
+            bucket.tokens = min(bucket.rate, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            if bucket.tokens < 1:
+                bucket.suppressed += 1
+                return False
+            bucket.tokens -= 1
+            if bucket.suppressed:
+                record.suppressed = bucket.suppressed
+                bucket.suppressed = 0
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "category": getattr(record, "category", record.name),
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        for key in ("sample_rate", "suppressed"):
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the queue is full the record is dropped and counted."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # formatting to JSON happens on the listener thread; only freeze the message and traceback here
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class FieldLogger(logging.LoggerAdapter):
+    """Logger whose keyword arguments become JSON fields: ``log.info("saved", rows=3)``."""
+
+    def process(self, msg, kwargs):
+        reserved = {k: kwargs.pop(k) for k in ("exc_info", "stack_info", "stacklevel") if k in kwargs}
+        reserved["extra"] = {"fields": kwargs}
+        return msg, reserved
+
+
+def configure(stream=None):
+    """Install the queue handler and start the writer thread. Safe to call more than once."""
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JSONFormatter())
+        records = queue.Queue(maxsize=LOG_QUEUE_MAX)
+        _handler = _DroppingQueueHandler(records)
+        _handler.addFilter(SamplingFilter(_parse(LOG_SAMPLE), _parse(LOG_RATE)))
+
+        root = logging.getLogger(ROOT)
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(_handler)
+        root.propagate = False
+
+        _listener = QueueListener(records, output)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """Write out whatever is still queued and stop the writer thread."""
+    global _listener, _handler
+    with _lock:
+        listener, _listener = _listener, None
+        handler, _handler = _handler, None
+    if handler is not None:
+        logging.getLogger(ROOT).removeHandler(handler)
+    if listener is not None:
+        listener.stop()
+
+
+def stats() -> dict:
+    if _handler is None:
+        return {"queue_depth": 0, "dropped": 0}
+    return {"queue_depth": _handler.queue.qsize(), "dropped": _handler.dropped}
+
+
+def get_logger(category: str) -> FieldLogger:
+    configure()
+    return FieldLogger(logging.getLogger(f"{ROOT}.{category}"), {})
+
+
+def redact_phone(number: str | None) -> str | None:
+    """Keep only the last four digits of a phone number for logs."""
+    if not number:
+        return number
+    return "***" + number[-4:]
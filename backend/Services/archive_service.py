@@ -0,0 +1,120 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+from Database.database import SessionLocal
+from Models.location import Location
+from Models.location_sessions import LocationSession
+from Models.session_archive import SessionArchive
+from Services import track_codec
+from Services.app_logging import get_logger
+
+# Ended sessions are archived this long after they end...
+ARCHIVE_AFTER_S = float(os.getenv("ARCHIVE_AFTER_S", "3600"))
+# ...and their raw rows are deleted from locations this long after they end.
+RAW_RETENTION_DAYS = float(os.getenv("RAW_RETENTION_DAYS", "30"))
+# How often the background job runs, when RETENTION_ENABLED=1.
+RETENTION_INTERVAL_S = float(os.getenv("RETENTION_INTERVAL_S", "600"))
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "0") == "1"
+# Sessions handled per pass, so one run never holds the table for long.
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "100"))
+
+log = get_logger("retention")
+
+
+def archive_ended_sessions(db: Session, min_age_s: float = ARCHIVE_AFTER_S, batch: int = RETENTION_BATCH) -> int:
+    """Encode the points of ended, not yet archived sessions into archive blobs."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=min_age_s)
+    sessions = (
+        db.query(LocationSession)
+        .outerjoin(SessionArchive, SessionArchive.session_id == LocationSession.id)
+        .filter(
+            LocationSession.is_active == False,
+            LocationSession.ended_at <= cutoff,
+            SessionArchive.session_id.is_(None),
+        )
+        .order_by(LocationSession.id)
+        .limit(batch)
+        .all()
+    )
+
+    for session in sessions:
+        points = (
+            db.query(Location)
+            .filter(Location.session_id == session.id)
+            .order_by(Location.timestamp, Location.id)
+            .all()
+        )
+        db.add(SessionArchive(
+            session_id=session.id,
+            user_id=session.user_id,
+            point_count=len(points),
+            first_timestamp=points[0].timestamp if points else None,
+            last_timestamp=points[-1].timestamp if points else None,
+            encoding=track_codec.ENCODING,
+            data=track_codec.encode(points),
+        ))
+        db.commit()
+        # the raw points are no longer needed; don't keep them in the identity map
+        for point in points:
+            db.expunge(point)
+    return len(sessions)
+
+
+def purge_archived_raw(db: Session, retention_days: float = RAW_RETENTION_DAYS, batch: int = RETENTION_BATCH) -> int:
+    """Delete raw rows of archived sessions that ended more than ``retention_days`` ago."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    archives = (
+        db.query(SessionArchive)
+        .join(LocationSession, LocationSession.id == SessionArchive.session_id)
+        .filter(
+            SessionArchive.raw_deleted_at.is_(None),
+            LocationSession.ended_at <= cutoff,
+        )
+        .order_by(SessionArchive.session_id)
+        .limit(batch)
+        .all()
+    )
+
+    deleted = 0
+    for archive in archives:
+        result = db.execute(delete(Location).where(Location.session_id == archive.session_id))
+        archive.raw_deleted_at = datetime.now(timezone.utc)
+        db.commit()
+        deleted += result.rowcount or 0
+    return deleted
+
+
+def get_archived_points(db: Session, session_id: int) -> list[track_codec.ArchivedPoint] | None:
+    """Points of a session whose raw rows were purged, or None if they are still live."""
+    archive = db.get(SessionArchive, session_id)
+    if archive is None or archive.raw_deleted_at is None:
+        return None
+    return track_codec.decode(archive.data, archive.user_id, archive.session_id)
+
+
+def run_retention_once() -> tuple[int, int]:
+    db = SessionLocal()
+    try:
+        archived = archive_ended_sessions(db)
+        deleted = purge_archived_raw(db)
+    finally:
+        db.close()
+    if archived or deleted:
+        log.info("retention pass", archived_sessions=archived, deleted_rows=deleted)
+    return archived, deleted
+
+
+async def run_retention_loop(interval_s: float = RETENTION_INTERVAL_S):
+    while True:
+        try:
+            await asyncio.to_thread(run_retention_once)
+        except Exception:
+            log.exception("retention pass failed")
+        await asyncio.sleep(interval_s)
+
+
+if __name__ == "__main__":
+    # python -m Services.archive_service  runs a single archive + purge pass
+    run_retention_once()
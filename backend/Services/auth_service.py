@@ -2,25 +2,38 @@ from datetime import datetime, timedelta, timezone
 import jwt
 import bcrypt
 import os
+from fastapi import Header, HTTPException
+from Services.hashing_pool import hashing_pool
+from Services.token_cache import token_cache
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your_super_secret_key")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# lifetime of the tracking links sent by SMS
+TRACK_LINK_TTL_HOURS = float(os.getenv("TRACK_LINK_TTL_HOURS", "24"))
+TRACK_SCOPE = "track"
 
-def hash_password(password: str) -> str:
+def _hashpw(password: str) -> str:
     # Encode to bytes, hash, decode back to string for storage
     return bcrypt.hashpw(
         password.encode("utf-8"),
         bcrypt.gensalt()
     ).decode("utf-8")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def _checkpw(plain_password: str, hashed_password: str) -> bool:
     # Both must be bytes for checkpw
     return bcrypt.checkpw(
         plain_password.encode("utf-8"),
         hashed_password.encode("utf-8")
     )
 
+async def hash_password(password: str) -> str:
+    # bcrypt is deliberately slow, so it runs on the bounded hashing pool
+    return await hashing_pool.run(_hashpw, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await hashing_pool.run(_checkpw, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -30,7 +43,43 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 
 def decode_access_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = token_cache.decode(token, SECRET_KEY, ALGORITHM)
         return payload
     except Exception:
-        return None
\ No newline at end of file
+        return None
+
+def create_share_token(user_id: int, expires_delta: timedelta | None = None) -> str:
+    """Token that only lets its holder watch ``user_id``'s live location.
+
+    It carries no ``id`` claim, so it is never accepted as a login token.
+    """
+    return create_access_token(
+        {"scope": TRACK_SCOPE, "target": user_id},
+        expires_delta or timedelta(hours=TRACK_LINK_TTL_HOURS),
+    )
+
+def decode_share_token(token: str, user_id: int):
+    """Claims of a valid share token for ``user_id``, otherwise None."""
+    payload = decode_access_token(token)
+    if not payload or payload.get("scope") != TRACK_SCOPE or payload.get("target") != user_id:
+        return None
+    return payload
+
+def require_user(authorization: str | None = Header(None)) -> dict:
+    """FastAPI dependency: claims of the caller's login token, or 401.
+
+    Share tokens from tracking links are refused; they only open /track/.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing Authorization Header",
+                            headers={"WWW-Authenticate": "Bearer"})
+    payload = decode_access_token(authorization.split(" ", 1)[1])
+    if not payload or "id" not in payload or payload.get("scope") == TRACK_SCOPE:
+        raise HTTPException(status_code=401, detail="Invalid or expired Token",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return payload
+
+def require_self(user_id: int, claims: dict):
+    """403 unless the authenticated caller is ``user_id``."""
+    if claims["id"] != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed for this user")
@@ -0,0 +1,140 @@
+import math
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in metres between two WGS84 points."""
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def valid_coordinates(lat, lng) -> bool:
+    return (
+        isinstance(lat, (int, float)) and isinstance(lng, (int, float))
+        and -90 <= lat <= 90 and -180 <= lng <= 180
+    )
+
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+
+
+def geohash_encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Standard base-32 geohash; shared prefixes mean nearby cells."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    ch = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits = 0
+            ch = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int) -> tuple[float, float]:
+    """(height, width) in degrees of a geohash cell at ``precision``."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def bounding_box(lat: float, lng: float, radius_m: float) -> tuple[float, float, float, float]:
+    """(min_lat, min_lng, max_lat, max_lng) enclosing a circle, clamped to valid ranges."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = min(180.0, dlat / cos_lat)
+    return (
+        max(-90.0, lat - dlat), max(-180.0, lng - dlng),
+        min(90.0, lat + dlat), min(180.0, lng + dlng),
+    )
+
+
+def geohash_cover(min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+                  max_cells: int = 16) -> list[str]:
+    """Geohash prefixes whose cells together cover the box.
+
+    Uses the finest precision that needs at most ``max_cells`` prefixes, so
+    each prefix is a tight index range scan.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_size(precision)
+        rows = math.floor((max_lat - min_lat) / height) + 2
+        cols = math.floor((max_lng - min_lng) / width) + 2
+        if rows * cols > max_cells and precision > 1:
+            continue
+        cells = set()
+        # sample at cell spacing so every cell touching the box is hit once
+        for i in range(rows):
+            sample_lat = min(min_lat + i * height, max_lat)
+            for j in range(cols):
+                sample_lng = min(min_lng + j * width, max_lng)
+                cells.add(geohash_encode(sample_lat, sample_lng, precision))
+        return sorted(cells)
+    return [""]
+
+
+def _segment_distance_m(p: tuple[float, float], a: tuple[float, float], b: tuple[float, float]) -> float:
+    """Distance from ``p`` to segment ``ab``; all three already projected to metres."""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length2))
+    return math.hypot(p[0] - a[0] - t * dx, p[1] - a[1] - t * dy)
+
+
+def simplify_track(points: list, tolerance_m: float) -> list:
+    """Ramer-Douglas-Peucker over ``(lat, lng, ...)`` tuples, keeping the endpoints.
+
+    Drops every point within ``tolerance_m`` of the line its neighbours
+    would draw anyway. Uses a flat projection, which is fine over the few
+    kilometres a buffered trail covers.
+    """
+    n = len(points)
+    if n < 3:
+        return list(points)
+    ky = math.radians(1) * EARTH_RADIUS_M
+    kx = ky * math.cos(math.radians(points[0][0]))
+    xy = [(p[1] * kx, p[0] * ky) for p in points]
+
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    # explicit stack: a long straight trail would otherwise recurse once per point
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        farthest, distance = 0, tolerance_m
+        for i in range(first + 1, last):
+            d = _segment_distance_m(xy[i], xy[first], xy[last])
+            if d > distance:
+                farthest, distance = i, d
+        if farthest:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [p for p, kept in zip(points, keep) if kept]
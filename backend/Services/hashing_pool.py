@@ -0,0 +1,73 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+
+# bcrypt releases the GIL, so a small dedicated thread pool hashes in
+# parallel without touching the AnyIO pool that serves the sync routes.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hashes allowed to wait for a worker before new ones are refused with 503.
+HASH_QUEUE_MAX = int(os.getenv("HASH_QUEUE_MAX", "32"))
+HASH_RETRY_AFTER = os.getenv("HASH_RETRY_AFTER", "1")
+
+
+class HashingPool:
+    """Bounded executor for password hashing and verification.
+
+    At most ``workers`` hashes run at once and at most ``max_queue`` more may
+    wait; anything beyond that is rejected immediately with a 503 so a login
+    storm cannot build an unbounded backlog.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_queue: int = HASH_QUEUE_MAX):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hashing")
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, please retry",
+                headers={"Retry-After": HASH_RETRY_AFTER},
+            )
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            return started - submitted, fn(*args)
+
+        self.in_flight += 1
+        try:
+            wait, result = await asyncio.wrap_future(self._executor.submit(timed))
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth(),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+
+hashing_pool = HashingPool()
@@ -0,0 +1,51 @@
+import os
+import uuid
+from typing import Callable
+
+# Cross-worker cache invalidation. A cache registers a handler per kind;
+# publish() runs it in this worker at once and, once connect() has been
+# called, sends it over the broker so every other worker runs it too.
+#
+#   invalidation.on("recipients", _drop_recipients)
+#   invalidation.publish("recipients", user_id)
+#
+# Broker frames published while it is disconnected are lost, so caches
+# still keep a TTL as a backstop.
+
+INVALIDATE_CHANNEL = "invalidate"
+
+# identifies this worker's own messages when the broker echoes them back
+_origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_handlers: dict[str, Callable[[int], None]] = {}
+_publish: Callable[[dict], None] | None = None
+
+
+def on(kind: str, handler: Callable[[int], None]):
+    _handlers[kind] = handler
+
+
+def connect(publish: Callable[[dict], None] | None):
+    """Send invalidations through ``publish``; it must be safe to call from any thread.
+
+    ``None`` goes back to invalidating this worker only.
+    """
+    global _publish
+    _publish = publish
+
+
+def publish(kind: str, key: int, local: bool = True):
+    """Invalidate ``key`` everywhere; ``local=False`` skips this worker,
+    for callers that have already updated their own copy."""
+    if local:
+        _handlers[kind](key)
+    if _publish is not None:
+        _publish({"kind": kind, "key": key, "origin": _origin})
+
+
+def deliver(message: dict):
+    """Apply an invalidation received from the broker."""
+    if message.get("origin") == _origin:
+        return
+    handler = _handlers.get(message.get("kind"))
+    if handler is not None:
+        handler(message["key"])
@@ -1,7 +1,22 @@
 from fastapi import HTTPException
+from sqlalchemy import insert, or_, and_, select
+from datetime import datetime, timezone
+import base64
+import os
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from Models.location import Location
-from Models.location_sessions import LocationSession
+from Services import session_registry, archive_service
+from Services.geo import geohash_encode, simplify_track
+from Services.trajectory_filter import TrajectoryFilter
+from Services.app_logging import get_logger
+
+log = get_logger("location")
+
+# Summarized trail sent to watchers with a replayed batch: points closer than
+# this to the simplified line are dropped, and at most TRAIL_MAX_POINTS remain.
+TRAIL_TOLERANCE_M = float(os.getenv("LOCATION_TRAIL_TOLERANCE_M", "10"))
+TRAIL_MAX_POINTS = int(os.getenv("LOCATION_TRAIL_MAX_POINTS", "100"))
 
 
 def save_location(db: Session, user_id: int, lat: float, lng: float, accuracy: float | None = None):
@@ -10,29 +25,233 @@ def save_location(db: Session, user_id: int, lat: float, lng: float, accuracy: f
     The location is associated with the user's *currently active* session
     if one exists; otherwise ``session_id`` remains ``None``.
     """
-    print(f"[LocationService] Saving location for user {user_id}: lat={lat}, lng={lng}, accuracy={accuracy}")
-    
     # optionally grab active session id
-    active = db.query(LocationSession).filter(
-        LocationSession.user_id == user_id,
-        LocationSession.is_active == True,
-    ).first()
-    
-    print(f"[LocationService] Active session: {active.id if active else 'None'}")
+    session_id = session_registry.lookup(db, user_id)
 
     loc = Location(
         user_id=user_id,
-        session_id=active.id if active else None,
+        session_id=session_id,
         latitude=lat,
         longitude=lng,
         accuracy=accuracy,
+        geohash=geohash_encode(lat, lng),
     )
     db.add(loc)
     db.commit()
     db.refresh(loc)
-    print(f"[LocationService] Location saved with ID {loc.id}")
+    # no coordinates in logs
+    log.debug("location saved", user_id=user_id, session_id=session_id, location_id=loc.id)
     return loc
 
 
+def _sessionless(rows: list[dict]) -> set[int]:
+    return {r["user_id"] for r in rows if r.get("session_id") is None}
+
+
+def _prepare_rows(rows: list[dict], sessions: dict[int, int]):
+    # rows stamped without a session (e.g. it was started on another worker)
+    # get the one the database has, looked up once per batch
+    for r in rows:
+        if r.get("session_id") is None:
+            r["session_id"] = sessions.get(r["user_id"])
+        r.setdefault("geohash", geohash_encode(r["latitude"], r["longitude"]))
+
+
+def save_locations_bulk(db: Session, rows: list[dict]):
+    """Persist many location readings with a single multi-row insert.
+
+    Each row is a dict with ``user_id``, ``latitude``, ``longitude``,
+    ``accuracy`` and ``timestamp``. Rows are attached to their user's active
+    session unless they already carry a ``session_id``.
+    """
+    if not rows:
+        return 0
+
+    _prepare_rows(rows, session_registry.lookup_many(db, _sessionless(rows)))
+
+    db.execute(insert(Location), rows)
+    db.commit()
+    return len(rows)
+
+
+async def save_locations_bulk_async(db: AsyncSession, rows: list[dict]):
+    """Async variant of ``save_locations_bulk`` used by the location writer."""
+    if not rows:
+        return 0
+
+    _prepare_rows(rows, await session_registry.lookup_many_async(db, _sessionless(rows)))
+
+    await db.execute(insert(Location), rows)
+    await db.commit()
+    return len(rows)
+
+
+async def get_latest_location_async(db: AsyncSession, session_id: int):
+    """Newest stored point of a session, or None."""
+    result = await db.execute(
+        select(Location)
+        .where(Location.session_id == session_id)
+        .order_by(Location.timestamp.desc(), Location.id.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+
+async def save_location_batch_async(db: AsyncSession, user_id: int, points) -> list[dict]:
+    """Store buffered fixes replayed by a client, with one multi-row insert.
+
+    ``points`` are ``LocationPoint``s in any order. They are sorted by the
+    phone's own timestamps, which are kept, and thinned with the same rules
+    as live fixes. Returns the stored rows, oldest first.
+    """
+    # a fresh filter: its clock is the client's timestamps, not the live one
+    thinning = TrajectoryFilter()
+    rows = []
+    for p in sorted(points, key=lambda p: _utc(p.timestamp)):
+        ts = _utc(p.timestamp)
+        if not thinning.accept(user_id, p.lat, p.lng, p.accuracy, ts=ts.timestamp()):
+            continue
+        rows.append({
+            "user_id": user_id,
+            "latitude": p.lat,
+            "longitude": p.lng,
+            "accuracy": p.accuracy,
+            "timestamp": ts,
+        })
+    await save_locations_bulk_async(db, rows)
+    log.debug("location batch saved", user_id=user_id, received=len(points), stored=len(rows))
+    return rows
+
+
+def summarize_trail(rows: list[dict]) -> list[list]:
+    """``[lat, lng, unix ms]`` triples outlining a batch's path, for watchers."""
+    trail = [(r["latitude"], r["longitude"], int(r["timestamp"].timestamp() * 1000)) for r in rows]
+    trail = simplify_track(trail, TRAIL_TOLERANCE_M)
+    if len(trail) > TRAIL_MAX_POINTS:
+        # still too long: keep evenly spaced points, always including both ends
+        step = (len(trail) - 1) / (TRAIL_MAX_POINTS - 1)
+        trail = [trail[round(i * step)] for i in range(TRAIL_MAX_POINTS)]
+    return [list(p) for p in trail]
+
+
 def get_session_locations(db: Session, session_id: int):
-    return db.query(Location).filter(Location.session_id == session_id).all()
+    archived = _archived_history(db, session_id, None, None)
+    if archived is not None:
+        return archived
+    return db.query(Location).filter(Location.session_id == session_id).order_by(Location.timestamp, Location.id).all()
+
+
+def encode_cursor(location: Location) -> str:
+    raw = f"{location.timestamp.isoformat()}|{location.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        ts, _, loc_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").partition("|")
+        return datetime.fromisoformat(ts), int(loc_id)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _history_query(db: Session, session_id: int, start: datetime | None, end: datetime | None,
+                   after: tuple[datetime, int] | None = None):
+    # timestamps are stored as naive UTC; query params may carry an offset
+    start, end = _naive_utc(start), _naive_utc(end)
+    if after is not None:
+        after = (_naive_utc(after[0]), after[1])
+    query = db.query(Location).filter(Location.session_id == session_id)
+    if start is not None:
+        query = query.filter(Location.timestamp >= start)
+    if end is not None:
+        query = query.filter(Location.timestamp < end)
+    if after is not None:
+        # keyset: strictly after the last (timestamp, id) the client has seen
+        ts, loc_id = after
+        query = query.filter(or_(
+            Location.timestamp > ts,
+            and_(Location.timestamp == ts, Location.id > loc_id),
+        ))
+    return query.order_by(Location.timestamp, Location.id)
+
+
+def _naive_utc(ts: datetime | None) -> datetime | None:
+    if ts is None or ts.tzinfo is None:
+        return ts
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _archived_history(db: Session, session_id: int, start: datetime | None, end: datetime | None,
+                      after: tuple[datetime, int] | None = None):
+    """Same filtering as ``_history_query``, applied to a purged session's archive.
+
+    Returns None while the session's raw rows are still in ``locations``.
+    """
+    points = archive_service.get_archived_points(db, session_id)
+    if points is None:
+        return None
+    start, end = _naive_utc(start), _naive_utc(end)
+    if after is not None:
+        after = (_naive_utc(after[0]), after[1])
+    return [
+        p for p in points
+        if (start is None or p.timestamp >= start)
+        and (end is None or p.timestamp < end)
+        and (after is None or (p.timestamp, p.id) > after)
+    ]
+
+
+def _downsample(locations, every_s: float | None):
+    """Keep at most one point per ``every_s`` seconds."""
+    last = None
+    for loc in locations:
+        if every_s and last is not None and (loc.timestamp - last).total_seconds() < every_s:
+            continue
+        last = loc.timestamp
+        yield loc
+
+
+def get_session_history(db: Session, session_id: int, limit: int = 500, cursor: str | None = None,
+                        start: datetime | None = None, end: datetime | None = None,
+                        every_s: float | None = None) -> dict:
+    """One page of a session's points in (timestamp, id) order.
+
+    ``next_cursor`` is set while more rows remain; pass it back to continue
+    after the last row scanned. Downsampling applies within a page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    archived = _archived_history(db, session_id, start, end, after)
+    if archived is not None:
+        rows = archived[:limit]
+    else:
+        rows = _history_query(db, session_id, start, end, after).limit(limit).all()
+    return {
+        "items": list(_downsample(rows, every_s)),
+        "next_cursor": encode_cursor(rows[-1]) if len(rows) == limit else None,
+    }
+
+
+def stream_session_history(db: Session, session_id: int, start: datetime | None = None,
+                           end: datetime | None = None, every_s: float | None = None,
+                           batch_size: int = 1000):
+    """Yield every matching point through a server-side cursor.
+
+    Rows are fetched ``batch_size`` at a time, so memory stays flat no matter
+    how long the session is. Archived sessions are decoded in one go; the
+    blob is already a compact, bounded copy of the track.
+    """
+    archived = _archived_history(db, session_id, start, end)
+    if archived is not None:
+        yield from _downsample(archived, every_s)
+        return
+
+    query = (
+        _history_query(db, session_id, start, end)
+        .execution_options(stream_results=True)
+        .yield_per(batch_size)
+    )
+    yield from _downsample(query, every_s)
@@ -2,7 +2,18 @@ from fastapi import HTTPException
 from Models.location_sessions import LocationSession
 from Models.user import User 
 from datetime import datetime, timezone 
+from sqlalchemy import update
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from Services import session_registry
+
+def _end_active(user_id: int):
+    # by user rather than by registry id: another worker may have started it
+    return (
+        update(LocationSession)
+        .where(LocationSession.user_id == user_id, LocationSession.is_active == True)
+        .values(is_active=False, ended_at=datetime.now(timezone.utc))
+    )
 
 def createLocationsession(db: Session, user_id: int):
     user = db.query(User).filter(User.id == user_id).first()
@@ -10,20 +21,29 @@ def createLocationsession(db: Session, user_id: int):
         raise HTTPException(status_code=404, detail="User not found")
     
     # End any existing active session first
-    active_session = db.query(LocationSession).filter(
-        LocationSession.user_id == user_id,
-        LocationSession.is_active == True
-    ).first()
-
-    if active_session:
-        active_session.is_active = False
-        active_session.ended_at = datetime.now(timezone.utc)
-        db.commit()
+    db.execute(_end_active(user_id))
     
     new_session = LocationSession(user_id=user_id)
     db.add(new_session)
     db.commit()
     db.refresh(new_session)
+    session_registry.set_active(user_id, new_session.id)
+    return new_session
+
+async def createLocationsession_async(db: AsyncSession, user_id: int):
+    """Async variant of ``createLocationsession`` for the websocket handler."""
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # End any existing active session first
+    await db.execute(_end_active(user_id))
+
+    new_session = LocationSession(user_id=user_id)
+    db.add(new_session)
+    await db.commit()
+    await db.refresh(new_session)
+    session_registry.set_active(user_id, new_session.id)
     return new_session
 
 def end_session(db: Session, user_id: int, session_id: int):
@@ -41,20 +61,56 @@ def end_session(db: Session, user_id: int, session_id: int):
     session.ended_at = datetime.now(timezone.utc)
     db.commit()
     db.refresh(session)
+    session_registry.clear(user_id, session_id)
+    return session
+
+async def end_session_async(db: AsyncSession, user_id: int, session_id: int):
+    """Async variant of ``end_session`` for the websocket handler."""
+    session = await db.get(LocationSession, session_id)
+    if not session or session.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    if not session.is_active:
+        raise HTTPException(status_code=400, detail="Session is already ended")
+
+    session.is_active = False
+    session.ended_at = datetime.now(timezone.utc)
+    await db.commit()
+    session_registry.clear(user_id, session_id)
     return session
 
 def get_active_session(db: Session, user_id: int):
-    session = db.query(LocationSession).filter(
-        LocationSession.user_id == user_id,
-        LocationSession.is_active == True
-    ).first() 
+    # a registry hit needs only a primary-key read; a miss checks the database
+    session_id = session_registry.lookup(db, user_id, refresh=True)
+    session = db.get(LocationSession, session_id) if session_id else None
+    if session and not session.is_active:
+        # ended on another worker
+        session_registry.clear(user_id, session_id)
+        session_id = session_registry.lookup(db, user_id, refresh=True)
+        session = db.get(LocationSession, session_id) if session_id else None
     if not session:
         raise HTTPException(status_code=404, detail="No active session found")
     return session 
 
-def get_all_sessions(db: Session, user_id: int):
-    return db.query(LocationSession).filter(
+def get_all_sessions(db: Session, user_id: int, limit: int | None = None, after_id: int | None = None):
+    """Every session of the user, oldest first.
+
+    Paged only on request: ``limit`` caps the page and the last id seen,
+    passed as ``after_id``, continues after it.
+    """
+    query = db.query(LocationSession).filter(
         LocationSession.user_id == user_id
-    ).all() 
+    )
+    if after_id is not None:
+        query = query.filter(LocationSession.id > after_id)
+    query = query.order_by(LocationSession.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
 
+def get_user_session(db: Session, user_id: int, session_id: int):
+    session = db.get(LocationSession, session_id)
+    if not session or session.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
@@ -0,0 +1,140 @@
+import asyncio
+import math
+import os
+from datetime import datetime, timezone
+from sqlalchemy.exc import OperationalError
+from Database.database import AsyncSessionLocal
+from Services import locationService, session_registry
+from Services.geo import valid_coordinates
+from Services.app_logging import get_logger
+
+# Flush thresholds for the write-behind queue. A batch is written as soon as
+# it holds LOCATION_BATCH_SIZE rows or LOCATION_FLUSH_INTERVAL seconds after
+# its first row arrived, whichever comes first.
+BATCH_SIZE = int(os.getenv("LOCATION_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("LOCATION_FLUSH_INTERVAL", "0.5"))
+MAX_QUEUE = int(os.getenv("LOCATION_QUEUE_MAX", "50000"))
+
+log = get_logger("location_writer")
+
+_STOP = object()
+
+
+class LocationWriter:
+    """Write-behind ingestion queue for location readings.
+
+    Readings from every connected user are gathered in one in-process queue
+    and persisted as multi-row inserts by a single background task, so the
+    websocket handler never waits on a commit. Rows are checked on the way
+    in, and a batch that still fails is split until only the rows that
+    cannot be written are dropped.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 max_queue: int = MAX_QUEUE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: asyncio.Task | None = None
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.rows_rejected = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued and stop the background task."""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def enqueue(self, user_id: int, lat: float, lng: float, accuracy: float | None = None,
+                      timestamp: datetime | None = None) -> bool:
+        """Queue a reading for persistence. False if it was rejected as invalid.
+
+        Returns immediately unless the queue is full, in which case the caller
+        waits for room; that only slows down the sending socket.
+        """
+        if not valid_coordinates(lat, lng):
+            self.rows_rejected += 1
+            log.warning("invalid reading rejected", user_id=user_id)
+            return False
+        try:
+            accuracy = float(accuracy) if accuracy is not None else None
+        except (TypeError, ValueError):
+            accuracy = None
+        if accuracy is not None and not math.isfinite(accuracy):
+            accuracy = None
+        await self._queue.put({
+            "user_id": user_id,
+            # attach the session now, while it is still the active one
+            "session_id": session_registry.get(user_id),
+            "latitude": lat,
+            "longitude": lng,
+            "accuracy": accuracy,
+            # stamp on arrival so the stored time does not drift with flush delay
+            "timestamp": timestamp or datetime.now(timezone.utc),
+        })
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is _STOP:
+                break
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                # take whatever is already waiting before sleeping on the queue
+                try:
+                    row = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        row = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._flush(batch)
+
+        # drain anything that was queued behind the stop marker
+        leftover = []
+        while not self._queue.empty():
+            row = self._queue.get_nowait()
+            if row is not _STOP:
+                leftover.append(row)
+        for i in range(0, len(leftover), self.batch_size):
+            await self._flush(leftover[i:i + self.batch_size])
+
+    async def _flush(self, batch: list[dict]):
+        try:
+            async with AsyncSessionLocal() as db:
+                await locationService.save_locations_bulk_async(db, batch)
+            self.rows_written += len(batch)
+        except Exception as e:
+            if len(batch) > 1 and not isinstance(e, OperationalError):
+                # a bad row fails the whole insert; halve until it is isolated.
+                # Operational errors (database down, locked) would fail every half too.
+                mid = len(batch) // 2
+                await self._flush(batch[:mid])
+                await self._flush(batch[mid:])
+                return
+            self.rows_failed += len(batch)
+            log.error("failed to write batch", rows=len(batch), error=str(e))
+
+
+location_writer = LocationWriter()
@@ -0,0 +1,251 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+from Services.app_logging import get_logger
+
+# Process-local metrics rendered in the Prometheus text format (0.0.4).
+# Each worker process keeps its own numbers; scrape every worker.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; wide enough for a sub-millisecond cache hit and a slow Twilio call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+log = get_logger("metrics")
+
+_registry: list = []
+_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """A value that is set directly, or read from ``fn`` at scrape time.
+
+    ``fn`` may return a number, or a dict of label value -> number when the
+    gauge has exactly one label.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn: Callable | None = None):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+        self._fn = fn
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def render(self) -> list[str]:
+        values = self._values
+        if self._fn is not None:
+            result = self._fn()
+            values = {(k,): v for k, v in result.items()} if isinstance(result, dict) else {(): result}
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = []
+        with _lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for key, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        try:
+            samples = metric.render()
+        except Exception as e:
+            # one broken stats callback must not take the whole scrape down
+            log.warning("failed to collect metric", metric=metric.name, error=str(e))
+            continue
+        lines.extend(metric.header())
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+# --- database ----------------------------------------------------------------
+
+SQL_SECONDS = Histogram(
+    "db_statement_seconds", "SQL statement execution time by operation and table", ("engine", "statement"))
+POOL_WAIT_SECONDS = Histogram(
+    "db_pool_acquire_seconds", "Time to get a connection from the pool, including connecting", ("engine",))
+
+# engine name -> engine, for the pool gauges below
+_engines: dict = {}
+# called with (engine name, seconds) after every pool checkout
+_pool_wait_listeners: list[Callable[[str, float], None]] = []
+
+
+def on_pool_wait(fn: Callable[[str, float], None]):
+    """Also hand every pool checkout time to ``fn``, e.g. for admission control."""
+    _pool_wait_listeners.append(fn)
+
+
+def _pool_stat(method: str) -> Callable[[], dict]:
+    # not every pool class keeps these numbers (NullPool, StaticPool, ...)
+    return lambda: {
+        name: getattr(engine.pool, method)()
+        for name, engine in _engines.items()
+        if hasattr(engine.pool, method)
+    }
+
+
+Gauge("db_pool_checked_out", "Pooled connections currently in use", ("engine",), fn=_pool_stat("checkedout"))
+Gauge("db_pool_overflow", "Connections open beyond pool_size (negative while the pool is not full)", ("engine",),
+      fn=_pool_stat("overflow"))
+Gauge("db_pool_size", "Configured pool_size", ("engine",), fn=_pool_stat("size"))
+
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+[`\"]?(\w+)", re.I)
+
+
+def statement_label(statement: str) -> str:
+    """Low-cardinality name for a statement: its verb and first table, e.g. "SELECT locations"."""
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "?"
+    table = _TABLE.search(statement)
+    return f"{verb} {table.group(1)}" if table else verb
+
+
+def instrument_engine(engine, name: str):
+    """Time every statement and pool checkout of a (sync) SQLAlchemy engine.
+
+    For an AsyncEngine pass ``async_engine.sync_engine``. The pool wrapper is
+    installed on the current pool; a later ``engine.dispose()`` replaces it.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["_metrics_start"].pop()
+        SQL_SECONDS.observe(time.perf_counter() - started, engine=name, statement=statement_label(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # after_cursor_execute never fires for a failed statement
+        stack = context.connection.info.get("_metrics_start") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            waited = time.perf_counter() - start
+            POOL_WAIT_SECONDS.observe(waited, engine=name)
+            for listener in _pool_wait_listeners:
+                listener(name, waited)
+
+    pool.connect = timed_connect
+    _engines[name] = engine
+
+
+def stats_gauges(prefix: str, help: str, fn: Callable[[], dict]):
+    """Export every numeric entry of a ``stats()`` dict as ``{prefix}_{key}``.
+
+    Nested dicts become one gauge with a ``reason`` label.
+    """
+    for key, value in fn().items():
+        if isinstance(value, dict):
+            Gauge(f"{prefix}_{key}", f"{help}: {key}", ("reason",), fn=lambda key=key: dict(fn()[key]))
+        elif isinstance(value, (int, float)):
+            Gauge(f"{prefix}_{key}", f"{help}: {key}", fn=lambda key=key: fn()[key])
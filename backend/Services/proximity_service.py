@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+from Models.location import Location
+from Models.trusted_contacts import TrustedContacts
+from Services.geo import bounding_box, geohash_cover, haversine_m
+
+
+def _prefix_range(prefix: str):
+    # a plain range instead of LIKE 'prefix%', so every backend can use the index;
+    # "~" sorts after every geohash character
+    return and_(Location.geohash >= prefix, Location.geohash < prefix + "~")
+
+
+def _sharing_with(viewer_id: int):
+    # users who list the viewer as an accepted contact
+    return select(TrustedContacts.user_id).where(
+        TrustedContacts.contact_user_id == viewer_id,
+        TrustedContacts.status == "accepted",
+    )
+
+
+def find_nearby(db: Session, viewer_id: int, lat: float, lng: float, radius_m: float, minutes: int = 15,
+                limit: int = 100, exclude_user_id: int | None = None) -> list[dict]:
+    """Latest position of every user sharing with ``viewer_id`` seen within
+    ``radius_m`` in the last ``minutes``.
+
+    Candidate rows come from geohash prefix ranges covering the bounding box
+    (served by the geohash/timestamp index) plus the box itself; each is then
+    checked exactly with the haversine distance.
+    """
+    min_lat, min_lng, max_lat, max_lng = bounding_box(lat, lng, radius_m)
+    cells = geohash_cover(min_lat, min_lng, max_lat, max_lng)
+    since = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+
+    query = (
+        db.query(Location.user_id, Location.latitude, Location.longitude, Location.timestamp)
+        .filter(
+            or_(*[_prefix_range(cell) for cell in cells]),
+            Location.timestamp >= since,
+            Location.latitude.between(min_lat, max_lat),
+            Location.longitude.between(min_lng, max_lng),
+            Location.user_id.in_(_sharing_with(viewer_id)),
+        )
+        .order_by(Location.timestamp.desc())
+    )
+    if exclude_user_id is not None:
+        query = query.filter(Location.user_id != exclude_user_id)
+
+    nearby = {}
+    for user_id, p_lat, p_lng, ts in query:
+        # rows arrive newest first, so the first hit per user is their latest fix
+        if user_id in nearby:
+            continue
+        distance = haversine_m(lat, lng, float(p_lat), float(p_lng))
+        if distance <= radius_m:
+            nearby[user_id] = {
+                "user_id": user_id,
+                "latitude": float(p_lat),
+                "longitude": float(p_lng),
+                "distance_m": round(distance, 1),
+                "timestamp": ts,
+            }
+
+    return sorted(nearby.values(), key=lambda n: n["distance_m"])[:limit]
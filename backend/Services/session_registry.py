@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from Models.location_sessions import LocationSession
+from Services import invalidation
+
+# Map of user_id -> id of that user's active location session. It is rebuilt
+# from the database at startup and kept current by location_sessionService,
+# so hot paths rarely query location_sessions for it. Every change is
+# announced to the other workers, which drop their entry and re-read it.
+_active: dict[int, int] = {}
+_lock = threading.Lock()
+
+# A session started by another worker (or before a restart of this one) is
+# not in the map, so a miss falls back to the database. Misses are
+# remembered this long, so users without a session don't query every time.
+MISS_TTL_S = float(os.getenv("SESSION_MISS_TTL_S", "5"))
+_misses: dict[int, float] = {}
+
+
+def load(db: Session):
+    """Rebuild the registry from every session still marked active."""
+    rows = (
+        db.query(LocationSession.user_id, LocationSession.id)
+        .filter(LocationSession.is_active == True)
+        .order_by(LocationSession.id)
+        .all()
+    )
+    with _lock:
+        _active.clear()
+        # ordered by id, so the newest active session wins for each user
+        for user_id, session_id in rows:
+            _active[user_id] = session_id
+    return len(_active)
+
+
+def get(user_id: int) -> int | None:
+    return _active.get(user_id)
+
+
+def set_active(user_id: int, session_id: int):
+    with _lock:
+        _active[user_id] = session_id
+        _misses.pop(user_id, None)
+    invalidation.publish("session", user_id, local=False)
+
+
+def clear(user_id: int, session_id: int | None = None):
+    """Forget the user's active session, optionally only if it is ``session_id``."""
+    with _lock:
+        if session_id is None or _active.get(user_id) == session_id:
+            _active.pop(user_id, None)
+        _misses.pop(user_id, None)
+    invalidation.publish("session", user_id, local=False)
+
+
+def _forget(user_id: int):
+    # changed on another worker; the next lookup reads the database
+    with _lock:
+        _active.pop(user_id, None)
+        _misses.pop(user_id, None)
+
+
+invalidation.on("session", _forget)
+
+
+def _unknown(user_ids, refresh: bool) -> list[int]:
+    """Users neither in the map nor recently confirmed to have no session."""
+    now = time.monotonic()
+    return [u for u in set(user_ids) if u not in _active and (refresh or _misses.get(u, 0) <= now)]
+
+
+def _active_sessions_query(user_ids: list[int]):
+    # newest active session per user, like load()
+    return (
+        select(LocationSession.user_id, func.max(LocationSession.id))
+        .where(LocationSession.user_id.in_(user_ids), LocationSession.is_active == True)
+        .group_by(LocationSession.user_id)
+    )
+
+
+def _remember(user_ids: list[int], rows) -> dict[int, int]:
+    found = dict(rows)
+    now = time.monotonic()
+    expires = now + MISS_TTL_S
+    with _lock:
+        if len(_misses) > 10000:
+            for user_id in [u for u, t in _misses.items() if t <= now]:
+                del _misses[user_id]
+        for user_id in user_ids:
+            if user_id in found:
+                _active[user_id] = found[user_id]
+                _misses.pop(user_id, None)
+            else:
+                _misses[user_id] = expires
+    return found
+
+
+def lookup_many(db: Session, user_ids, refresh: bool = False) -> dict[int, int]:
+    """Active session id per user, reading the database for users the map doesn't know.
+
+    ``refresh`` also re-reads users recently found without a session.
+    """
+    unknown = _unknown(user_ids, refresh)
+    if unknown:
+        _remember(unknown, db.execute(_active_sessions_query(unknown)).all())
+    return {u: _active[u] for u in set(user_ids) if u in _active}
+
+
+async def lookup_many_async(db: AsyncSession, user_ids, refresh: bool = False) -> dict[int, int]:
+    unknown = _unknown(user_ids, refresh)
+    if unknown:
+        _remember(unknown, (await db.execute(_active_sessions_query(unknown))).all())
+    return {u: _active[u] for u in set(user_ids) if u in _active}
+
+
+def lookup(db: Session, user_id: int, refresh: bool = False) -> int | None:
+    return lookup_many(db, [user_id], refresh).get(user_id)
+
+
+async def lookup_async(db: AsyncSession, user_id: int, refresh: bool = False) -> int | None:
+    return (await lookup_many_async(db, [user_id], refresh)).get(user_id)
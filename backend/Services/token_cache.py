@@ -0,0 +1,64 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+import jwt
+
+# Verified tokens kept at once; the least recently used are evicted first.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+
+class TokenCache:
+    """Bounded LRU of verified JWT claims, keyed by a digest of the token.
+
+    A hit skips signature verification and JSON decoding. Entries are
+    dropped once the token's ``exp`` passes, so an expired token is never
+    served from the cache. Invalid tokens are not cached.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def decode(self, token: str, secret_key: str, algorithm: str) -> dict:
+        """Return the token's claims, raising ``jwt.InvalidTokenError`` like ``jwt.decode``."""
+        # the key covers the secret and algorithm so a token verified under one
+        # configuration is never accepted under another
+        key = hashlib.sha256(f"{algorithm}\0{secret_key}\0{token}".encode("utf-8")).digest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry[1])
+                del self._entries[key]
+            self.misses += 1
+
+        payload = jwt.decode(token, secret_key, algorithms=[algorithm])
+        exp = payload.get("exp")
+        if exp is None:
+            # without an expiry there is no safe eviction time
+            return payload
+
+        with self._lock:
+            self._entries[key] = (float(exp), dict(payload))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return payload
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
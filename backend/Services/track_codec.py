@@ -0,0 +1,110 @@
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import NamedTuple
+
+# Compact per-session encoding of location points.
+#
+# Points are stored column by column (ids, timestamps, latitudes, longitudes,
+# accuracies). Each column is delta-encoded against the previous point,
+# zigzag-mapped to unsigned and written as varints; the whole buffer is then
+# zlib-compressed. Coordinates keep the table's 6 decimal places exactly,
+# timestamps keep microseconds and accuracy is kept to the centimetre.
+ENCODING = "delta-v1"
+_EPOCH = datetime(1970, 1, 1)
+
+
+class ArchivedPoint(NamedTuple):
+    id: int
+    user_id: int
+    session_id: int
+    latitude: float
+    longitude: float
+    accuracy: float | None
+    timestamp: datetime
+
+
+def _zigzag(n: int) -> int:
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+
+def _unzigzag(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+
+def _write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(buf: bytes, pos: int) -> tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fixed6(value) -> int:
+    return int((Decimal(str(value)) * 1_000_000).to_integral_value())
+
+
+def _micros(ts: datetime) -> int:
+    # naive timestamps are UTC in this schema
+    delta = ts.replace(tzinfo=None) - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def encode(points) -> bytes:
+    """Encode points (objects with id, latitude, longitude, accuracy, timestamp)."""
+    columns = [[], [], [], [], []]
+    for p in points:
+        columns[0].append(p.id)
+        columns[1].append(_micros(p.timestamp))
+        columns[2].append(_fixed6(p.latitude))
+        columns[3].append(_fixed6(p.longitude))
+        # 0 marks a missing accuracy, otherwise centimetres + 1
+        columns[4].append(0 if p.accuracy is None else int(round(p.accuracy * 100)) + 1)
+
+    out = bytearray()
+    _write_varint(out, len(columns[0]))
+    for column in columns:
+        prev = 0
+        for value in column:
+            _write_varint(out, _zigzag(value - prev))
+            prev = value
+    return zlib.compress(bytes(out), 9)
+
+
+def decode(data: bytes, user_id: int, session_id: int) -> list[ArchivedPoint]:
+    buf = zlib.decompress(data)
+    count, pos = _read_varint(buf, 0)
+    columns = []
+    for _ in range(5):
+        column = []
+        prev = 0
+        for _ in range(count):
+            raw, pos = _read_varint(buf, pos)
+            prev += _unzigzag(raw)
+            column.append(prev)
+        columns.append(column)
+
+    ids, stamps, lats, lngs, accs = columns
+    return [
+        ArchivedPoint(
+            id=ids[i],
+            user_id=user_id,
+            session_id=session_id,
+            latitude=lats[i] / 1_000_000,
+            longitude=lngs[i] / 1_000_000,
+            accuracy=None if accs[i] == 0 else (accs[i] - 1) / 100,
+            timestamp=_EPOCH + timedelta(microseconds=stamps[i]),
+        )
+        for i in range(count)
+    ]
@@ -0,0 +1,119 @@
+import math
+import os
+import threading
+import time
+from Services.geo import haversine_m, valid_coordinates
+
+# Readings reporting a worse horizontal accuracy than this are dropped.
+MAX_ACCURACY_M = float(os.getenv("TRACK_MAX_ACCURACY_M", "100"))
+# A fix must move at least this far from the last accepted one...
+MIN_DISTANCE_M = float(os.getenv("TRACK_MIN_DISTANCE_M", "5"))
+# ...and arrive at least this long after it.
+MIN_INTERVAL_S = float(os.getenv("TRACK_MIN_INTERVAL_S", "1"))
+# Dead reckoning: drop a fix that lies within this distance of the position
+# predicted from the last two accepted fixes. 0 disables it; only enable it
+# once watching clients extrapolate between updates themselves.
+DEAD_RECKONING_TOLERANCE_M = float(os.getenv("TRACK_DR_TOLERANCE_M", "0"))
+# Always accept a fix after this much silence, so watchers see the user is live.
+MAX_SILENCE_S = float(os.getenv("TRACK_MAX_SILENCE_S", "30"))
+
+
+class _Track:
+    __slots__ = ("lat", "lng", "ts", "v_lat", "v_lng")
+
+    def __init__(self, lat: float, lng: float, ts: float):
+        self.lat = lat
+        self.lng = lng
+        self.ts = ts
+        # degrees per second between the last two accepted fixes
+        self.v_lat = None
+        self.v_lng = None
+
+
+class TrajectoryFilter:
+    """Online ingest filter that drops redundant or unreliable location fixes.
+
+    A fix is kept only if it is accurate enough, far enough and late enough
+    after the last kept fix, and (when dead reckoning is enabled) not where a
+    constant-velocity extrapolation already puts the user. The first fix,
+    and any fix after ``max_silence_s`` without one, is kept regardless.
+    Dropped fixes are neither stored nor broadcast.
+    """
+
+    def __init__(self, max_accuracy_m: float = MAX_ACCURACY_M, min_distance_m: float = MIN_DISTANCE_M,
+                 min_interval_s: float = MIN_INTERVAL_S, dr_tolerance_m: float = DEAD_RECKONING_TOLERANCE_M,
+                 max_silence_s: float = MAX_SILENCE_S):
+        self.max_accuracy_m = max_accuracy_m
+        self.min_distance_m = min_distance_m
+        self.min_interval_s = min_interval_s
+        self.dr_tolerance_m = dr_tolerance_m
+        self.max_silence_s = max_silence_s
+        self._tracks: dict[int, _Track] = {}
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.dropped: dict[str, int] = {"invalid": 0, "accuracy": 0, "interval": 0, "distance": 0, "predicted": 0}
+
+    def accept(self, user_id: int, lat, lng, accuracy=None, ts: float | None = None) -> bool:
+        """Return True if the fix should be persisted and forwarded."""
+        if not valid_coordinates(lat, lng):
+            return self._drop("invalid")
+        if accuracy is not None:
+            # clients send it as a number, a numeric string or garbage
+            try:
+                accuracy = float(accuracy)
+            except (TypeError, ValueError):
+                return self._drop("invalid")
+            if not math.isfinite(accuracy):
+                return self._drop("invalid")
+        inaccurate = accuracy is not None and self.max_accuracy_m and accuracy > self.max_accuracy_m
+
+        ts = time.monotonic() if ts is None else ts
+        with self._lock:
+            track = self._tracks.get(user_id)
+            # an inaccurate fix is still kept when it is the first one or ends
+            # MAX_SILENCE_S without a better one: a rough position beats none
+            if track is None:
+                self._tracks[user_id] = _Track(lat, lng, ts)
+                return self._accept()
+
+            dt = ts - track.ts
+            if dt < self.max_silence_s:
+                if inaccurate:
+                    return self._drop("accuracy")
+                if dt < self.min_interval_s:
+                    return self._drop("interval")
+                if haversine_m(track.lat, track.lng, lat, lng) < self.min_distance_m:
+                    return self._drop("distance")
+                if self.dr_tolerance_m and track.v_lat is not None:
+                    predicted_lat = track.lat + track.v_lat * dt
+                    predicted_lng = track.lng + track.v_lng * dt
+                    if haversine_m(predicted_lat, predicted_lng, lat, lng) < self.dr_tolerance_m:
+                        return self._drop("predicted")
+
+            if inaccurate:
+                # too rough to extrapolate from
+                track.v_lat = track.v_lng = None
+            elif dt > 0:
+                track.v_lat = (lat - track.lat) / dt
+                track.v_lng = (lng - track.lng) / dt
+            track.lat, track.lng, track.ts = lat, lng, ts
+            return self._accept()
+
+    def reset(self, user_id: int):
+        """Forget a user's track, e.g. when a session starts or the socket closes."""
+        with self._lock:
+            self._tracks.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {"accepted": self.accepted, "dropped": dict(self.dropped)}
+
+    def _accept(self) -> bool:
+        self.accepted += 1
+        return True
+
+    def _drop(self, reason: str) -> bool:
+        self.dropped[reason] += 1
+        return False
+
+
+trajectory_filter = TrajectoryFilter()
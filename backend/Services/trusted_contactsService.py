@@ -1,9 +1,37 @@
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from Models.trusted_contacts import TrustedContacts
 from Models.user import User
-from Schemas.trusted_contactSchema import TrustedContactCreate
-from sqlalchemy import or_
+from Schemas.trusted_contactSchema import TrustedContactCreate, ContactStatus
+from sqlalchemy import or_, select
+from collections import OrderedDict
+from typing import NamedTuple
+from Services import invalidation
+import os
+import threading
+import time
+
+# How long a resolved recipient list may be served without re-reading it.
+# Contact changes invalidate entries on every worker at once; the TTL bounds
+# how stale a watcher's phone or username can get, and covers invalidations
+# lost while the broker was unreachable.
+RECIPIENT_CACHE_TTL = float(os.getenv("RECIPIENT_CACHE_TTL", "30"))
+# Users whose lists are kept; the least recently used are evicted first.
+RECIPIENT_CACHE_MAX = int(os.getenv("RECIPIENT_CACHE_MAX", "10000"))
+
+
+class Recipient(NamedTuple):
+    id: int
+    phone: str | None
+    username: str
+
+
+# user_id -> (expires_at, recipients), least recently used first
+_recipient_cache: OrderedDict[int, tuple[float, list[Recipient]]] = OrderedDict()
+# bumped on every invalidation so an in-flight read cannot store a stale list
+_recipient_generation: dict[int, int] = {}
+_recipient_lock = threading.Lock()
 
 def create_contact(db: Session, user_id: int, contact_data: TrustedContactCreate):
 
@@ -46,6 +74,7 @@ def create_contact(db: Session, user_id: int, contact_data: TrustedContactCreate
     db.add(new_contact)
     db.commit()
     db.refresh(new_contact)
+    invalidate_recipients(user_id)
 
     return new_contact
 
@@ -57,23 +86,110 @@ def get_contacts(db: Session, user_id: int):
     return db.query(TrustedContacts).filter(TrustedContacts.user_id == user_id).all()
 
 
+def _recipients_query(user_id: int):
+    return (
+        select(User.id, User.phone, User.username)
+        .join(TrustedContacts, TrustedContacts.contact_user_id == User.id)
+        .where(
+            TrustedContacts.user_id == user_id,
+            TrustedContacts.status == "accepted",
+        )
+    )
+
+
+def _cached_recipients(user_id: int) -> list[Recipient] | None:
+    with _recipient_lock:
+        cached = _recipient_cache.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            _recipient_cache.move_to_end(user_id)
+            return cached[1]
+    return None
+
+
+def _store_recipients(user_id: int, generation: int, rows) -> list[Recipient]:
+    recipients = [Recipient(*r) for r in rows]
+    with _recipient_lock:
+        if _recipient_generation.get(user_id, 0) == generation:
+            _recipient_cache[user_id] = (time.monotonic() + RECIPIENT_CACHE_TTL, recipients)
+            _recipient_cache.move_to_end(user_id)
+            while len(_recipient_cache) > RECIPIENT_CACHE_MAX:
+                _recipient_cache.popitem(last=False)
+    return recipients
+
+
+def get_contact_recipients(db: Session, user_id: int) -> list[Recipient]:
+    """Return the registered users who watch ``user_id``.
+
+    Each accepted contact with a ``contact_user_id`` is resolved to its id,
+    phone and username with one joined query. The result is cached per user
+    until a contact change invalidates it or the TTL runs out.
+    """
+    cached = _cached_recipients(user_id)
+    if cached is not None:
+        return cached
+
+    generation = _recipient_generation.get(user_id, 0)
+    rows = db.execute(_recipients_query(user_id)).all()
+    return _store_recipients(user_id, generation, rows)
+
+
+async def get_contact_recipients_async(db: AsyncSession, user_id: int) -> list[Recipient]:
+    """Async variant of ``get_contact_recipients``; shares the same cache."""
+    cached = _cached_recipients(user_id)
+    if cached is not None:
+        return cached
+
+    generation = _recipient_generation.get(user_id, 0)
+    rows = (await db.execute(_recipients_query(user_id))).all()
+    return _store_recipients(user_id, generation, rows)
+
+
+def _drop_recipients(user_id: int):
+    with _recipient_lock:
+        _recipient_cache.pop(user_id, None)
+        _recipient_generation[user_id] = _recipient_generation.get(user_id, 0) + 1
+
+
+invalidation.on("recipients", _drop_recipients)
+
+
+def invalidate_recipients(user_id: int):
+    """Drop the cached recipients of ``user_id`` in every worker."""
+    invalidation.publish("recipients", user_id)
+
+
 def get_accepted_contact_ids(db: Session, user_id: int) -> list[int]:
     """Return a list of other user IDs that this user has accepted as contacts.
 
     Only contacts with a non-null ``contact_user_id`` are included because the
     websocket broadcast can only reach registered users.
     """
-    rows = (
-        db.query(TrustedContacts.contact_user_id)
-        .filter(
-            TrustedContacts.user_id == user_id,
-            TrustedContacts.status == "accepted",
-            TrustedContacts.contact_user_id.isnot(None),
-        )
-        .all()
-    )
-    # each row is a tuple, extract the first element
-    return [r[0] for r in rows]
+    return [r.id for r in get_contact_recipients(db, user_id)]
+
+
+def require_viewer(db: Session, user_id: int, viewer_id: int):
+    """403 unless ``viewer_id`` is ``user_id`` or one of their accepted contacts."""
+    if viewer_id != user_id and viewer_id not in get_accepted_contact_ids(db, user_id):
+        raise HTTPException(status_code=403, detail="Not allowed for this user")
+
+
+async def get_accepted_contact_ids_async(db: AsyncSession, user_id: int) -> list[int]:
+    return [r.id for r in await get_contact_recipients_async(db, user_id)]
+
+
+def update_contact_status(db: Session, user_id: int, contact_id: int, status: ContactStatus):
+    contact = db.query(TrustedContacts).filter(
+        TrustedContacts.id == contact_id,
+        TrustedContacts.user_id == user_id
+    ).first()
+    if not contact:
+        raise HTTPException(status_code=404, detail="Contact not found")
+
+    contact.status = status.value
+    db.commit()
+    db.refresh(contact)
+    invalidate_recipients(user_id)
+    return contact
 
 
 def delete_contact(db: Session, user_id: int, contact_id: int):
@@ -86,6 +202,7 @@ def delete_contact(db: Session, user_id: int, contact_id: int):
 
     db.delete(contact)
     db.commit()
+    invalidate_recipients(user_id)
 
 
 
@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from Services.app_logging import get_logger
+
+# Rendered audio lives on disk under TTS_CACHE_DIR and, up to
+# TTS_MEMORY_CACHE_BYTES, in memory for instant replay.
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", ".tts_cache")
+TTS_MEMORY_CACHE_BYTES = int(os.getenv("TTS_MEMORY_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+log = get_logger("tts_cache")
+
+
+def cache_key(text: str, voice_id: str, model_id: str, voice_settings: dict) -> str:
+    """Content address for one rendered clip.
+
+    Any change to the text, voice, model or settings produces a new key, so
+    stale audio is never served after a script or voice change.
+    """
+    canonical = json.dumps(
+        {"text": text, "voice_id": voice_id, "model_id": model_id, "voice_settings": voice_settings},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Two-level (memory LRU, then disk) store of rendered audio by key."""
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_memory_bytes: int = TTS_MEMORY_CACHE_BYTES):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    async def get(self, key: str) -> bytes | None:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return data
+
+        data = await asyncio.to_thread(self._read, key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, data)
+        return data
+
+    async def put(self, key: str, data: bytes):
+        self._remember(key, data)
+        try:
+            await asyncio.to_thread(self._write, key, data)
+        except OSError as e:
+            log.warning("could not write clip to disk", key=key, error=str(e))
+
+    async def contains(self, key: str) -> bool:
+        return key in self._memory or await asyncio.to_thread(os.path.exists, self._path(key))
+
+    def _read(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, data: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        # write then rename, so a reader never sees a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+
+audio_cache = AudioCache()
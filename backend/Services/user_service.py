@@ -1,19 +1,17 @@
 from fastapi import HTTPException
 from Models.user import User
-from sqlalchemy.orm import Session
-import bcrypt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from Services.auth_service import hash_password, verify_password
 
-def create_user(user_data, db: Session):
+async def create_user(user_data, db: AsyncSession):
     # Check if email already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = (await db.execute(select(User).where(User.email == user_data.email))).scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="User with this email already exists")
 
-    # Hash password correctly using bcrypt directly
-    hashed_password = bcrypt.hashpw(
-        user_data.password.encode("utf-8"),
-        bcrypt.gensalt()
-    ).decode("utf-8")
+    # Hash on the dedicated hashing pool, off the event loop
+    hashed_password = await hash_password(user_data.password)
 
     # Create User object
     new_user = User(
@@ -24,22 +22,21 @@ def create_user(user_data, db: Session):
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
-def authenticate_user(email: str, password: str, db: Session):
+async def authenticate_user(email: str, password: str, db: AsyncSession):
     # Find user by email
-    user = db.query(User).filter(User.email == email).first()
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if not user:
         return None
 
-    # Verify password correctly using bcrypt directly
-    if not bcrypt.checkpw(
-        password.encode("utf-8"),
-        user.password_hash.encode("utf-8")
-    ):
+    if not await verify_password(password, user.password_hash):
         return None
 
-    return user
\ No newline at end of file
+    return user
+
+async def get_user_async(db: AsyncSession, user_id: int):
+    return await db.get(User, user_id)
@@ -0,0 +1,98 @@
+"""Micro-benchmark: JWTMiddleware (BaseHTTPMiddleware) vs JWTASGIMiddleware.
+
+Drives each middleware stack directly through ASGI, without a server or
+network, so the numbers isolate per-request middleware overhead.
+
+    cd backend && python -m benchmarks.middleware_bench --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from middleware.middleware import JWTMiddleware, JWTASGIMiddleware
+from Services.token_cache import token_cache
+import jwt
+
+
+async def _plain(request):
+    return PlainTextResponse(str(request.state.user["id"]))
+
+
+async def _stream(request):
+    async def body():
+        for _ in range(16):
+            yield b"x" * 4096
+    return StreamingResponse(body(), media_type="audio/mpeg")
+
+
+def _build(middleware_cls):
+    app = Starlette(routes=[Route("/plain", _plain), Route("/stream", _stream)])
+    return middleware_cls(app)
+
+
+async def _call(app, path: str, token: str):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 5000),
+        "server": ("127.0.0.1", 8000),
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(3600)
+
+    status = None
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    assert status == 200, status
+
+
+async def _run(app, path: str, token: str, n: int) -> float:
+    for _ in range(min(200, n)):
+        await _call(app, path, token)
+    start = time.perf_counter()
+    for _ in range(n):
+        await _call(app, path, token)
+    return time.perf_counter() - start
+
+
+async def main(n: int):
+    token = jwt.encode({"id": 1, "exp": int(time.time()) + 3600}, os.environ["JWT_SECRET_KEY"], algorithm="HS256")
+    print(f"{'middleware':<22}{'route':<10}{'req/s':>12}{'us/req':>10}")
+    for path in ("/plain", "/stream"):
+        for cls in (JWTMiddleware, JWTASGIMiddleware):
+            token_cache.clear()
+            elapsed = await _run(_build(cls), path, token, n)
+            print(f"{cls.__name__:<22}{path:<10}{n / elapsed:>12.0f}{elapsed / n * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,503 @@
+"""Service-layer benchmarks against a seeded SQLite database.
+
+Times the hot paths of locationService, location_sessionService,
+trusted_contactsService, proximity_service, user_service and auth_service
+at a chosen dataset scale, writes the numbers as JSON and, given a saved
+baseline, reports and gates on regressions.
+
+    cd backend && python -m benchmarks.service_bench --scale 100k --out bench.json
+    cd backend && python -m benchmarks.service_bench --scale 100k --baseline bench.json --max-regression 20
+
+Each scale is seeded once into its own database file and reused, since the
+10m dataset takes minutes to build. --database-url points the run at any
+other database instead; the services are imported only after DATABASE_URL
+has been overridden.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+SCALES = {"1k": 1_000, "100k": 100_000, "10m": 10_000_000}
+POINTS_PER_SESSION = 500
+CONTACTS_PER_USER = 5
+PASSWORD = "benchmark-pw"
+
+BENCHMARKS = []
+
+
+def bench(name: str, iterations: int = 200, writes: bool = False):
+    """Register ``factory(ctx) -> op``; ``op`` is timed, sync or async.
+
+    Benchmarks that write run after all the read-only ones, so their rows
+    never show up in a read benchmark's result set.
+    """
+    def register(factory):
+        BENCHMARKS.append((name, iterations, writes, factory))
+        return factory
+    return register
+
+
+def _default_url(scale: str) -> str:
+    return f"sqlite:///{os.path.join(tempfile.gettempdir(), f'publicsafety_bench_{scale}.db')}"
+
+
+class Dataset:
+    """Ids and values the benchmarks query with, picked from the seeded data."""
+
+    def __init__(self, rows: int):
+        self.rows = rows
+        self.users = max(20, rows // 1000)
+        self.sessions = max(1, rows // POINTS_PER_SESSION)
+        # a session in the middle of the table, and its owner
+        self.session_id = self.sessions // 2 + 1
+        self.session_user = self.owner(self.session_id)
+        self.user_id = self.users // 2 + 1
+        self.email = f"bench{self.user_id}@example.com"
+        # the last user owns no seeded sessions; benchmarks that write do so as this user
+        self.writer_id = self.users
+        self.lat = 34.6794
+        self.lng = -82.8351
+
+    def owner(self, session_id: int) -> int:
+        return (session_id - 1) % (self.users - 1) + 1
+
+
+def seed(engine, ds: Dataset, password_hash: str):
+    """Fill an empty database with users, a contact ring, sessions and their points."""
+    from sqlalchemy import func, insert, select
+    from Models.user import User
+    from Models.trusted_contacts import TrustedContacts
+    from Models.location_sessions import LocationSession
+    from Models.location import Location
+    from Services.geo import geohash_encode
+
+    with engine.connect() as conn:
+        if (conn.execute(select(func.max(Location.id))).scalar() or 0) >= ds.rows:
+            return False
+
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+    rng = random.Random(42)
+    # the newest point is "now"; each session covers the POINTS_PER_SESSION seconds before the next one
+    end = datetime.now(timezone.utc).replace(tzinfo=None)
+    start = end - timedelta(seconds=ds.rows)
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"username": f"bench{i}", "email": f"bench{i}@example.com", "password_hash": password_hash,
+             "phone": f"+1555{i:07d}", "created_at": start}
+            for i in range(1, ds.users + 1)
+        ])
+        conn.execute(insert(TrustedContacts), [
+            {"user_id": i, "contact_user_id": (i + k - 1) % ds.users + 1, "contact_name": f"bench{k}",
+             "contact_email": f"bench{(i + k - 1) % ds.users + 1}@example.com", "status": "accepted"}
+            for i in range(1, ds.users + 1)
+            for k in range(1, CONTACTS_PER_USER + 1)
+        ])
+        # each user's newest session stays active
+        last = {ds.owner(s): s for s in range(1, ds.sessions + 1)}
+        conn.execute(insert(LocationSession), [
+            {"user_id": ds.owner(s),
+             "started_at": start + timedelta(seconds=(s - 1) * POINTS_PER_SESSION),
+             "ended_at": None if last[ds.owner(s)] == s else start + timedelta(seconds=s * POINTS_PER_SESSION),
+             "is_active": last[ds.owner(s)] == s}
+            for s in range(1, ds.sessions + 1)
+        ])
+
+    written = 0
+    batch = []
+    for s in range(1, ds.sessions + 1):
+        lat = ds.lat + rng.uniform(-0.05, 0.05)
+        lng = ds.lng + rng.uniform(-0.05, 0.05)
+        t0 = start + timedelta(seconds=(s - 1) * POINTS_PER_SESSION)
+        for p in range(min(POINTS_PER_SESSION, ds.rows - written)):
+            lat += rng.uniform(-1e-4, 1e-4)
+            lng += rng.uniform(-1e-4, 1e-4)
+            batch.append({"user_id": ds.owner(s), "session_id": s, "latitude": round(lat, 6), "longitude": round(lng, 6),
+                          "accuracy": 5.0, "timestamp": t0 + timedelta(seconds=p), "geohash": geohash_encode(lat, lng)})
+        if len(batch) >= 50_000 or s == ds.sessions:
+            with engine.begin() as conn:
+                conn.execute(insert(Location), batch)
+            written += len(batch)
+            print(f"[Bench] Seeded {written:,}/{ds.rows:,} locations", end="\r")
+            batch = []
+    print()
+    return True
+
+
+def cleanup(engine, ds: Dataset):
+    """Remove what the write benchmarks added, so a reused database stays at its seeded size."""
+    from sqlalchemy import delete
+    from Models.location import Location
+    from Models.location_sessions import LocationSession
+
+    with engine.begin() as conn:
+        conn.execute(delete(Location).where(Location.user_id == ds.writer_id))
+        conn.execute(delete(LocationSession).where(LocationSession.user_id == ds.writer_id))
+
+
+# --- locationService -------------------------------------------------------
+
+@bench("location.history_page", 300)
+def _history_page(ctx):
+    from Services import locationService
+    return lambda: locationService.get_session_history(ctx.db, ctx.ds.session_id, limit=100)
+
+
+@bench("location.history_page_cursor", 300)
+def _history_page_cursor(ctx):
+    from Services import locationService
+    cursor = locationService.get_session_history(ctx.db, ctx.ds.session_id, limit=250)["next_cursor"]
+    return lambda: locationService.get_session_history(ctx.db, ctx.ds.session_id, limit=100, cursor=cursor)
+
+
+@bench("location.session_locations", 100)
+def _session_locations(ctx):
+    from Services import locationService
+    return lambda: locationService.get_session_locations(ctx.db, ctx.ds.session_id)
+
+
+@bench("location.stream_history", 100)
+def _stream_history(ctx):
+    from Services import locationService
+    return lambda: sum(1 for _ in locationService.stream_session_history(ctx.db, ctx.ds.session_id))
+
+
+@bench("location.save_bulk_500", 50, writes=True)
+def _save_bulk(ctx):
+    from Services import locationService
+    now = datetime.now(timezone.utc)
+
+    def op():
+        locationService.save_locations_bulk(ctx.db, [
+            {"user_id": ctx.ds.writer_id, "session_id": None, "latitude": ctx.ds.lat, "longitude": ctx.ds.lng,
+             "accuracy": 5.0, "timestamp": now}
+            for _ in range(500)
+        ])
+    return op
+
+
+@bench("location.save_single", 200, writes=True)
+def _save_single(ctx):
+    from Services import locationService
+    return lambda: locationService.save_location(ctx.db, ctx.ds.writer_id, ctx.ds.lat, ctx.ds.lng, 5.0)
+
+
+@bench("proximity.find_nearby", 100)
+def _find_nearby(ctx):
+    from sqlalchemy import func
+    from Models.location import Location
+    from Services import proximity_service
+    newest = ctx.db.query(func.max(Location.timestamp)).filter(Location.user_id != ctx.ds.writer_id).scalar()
+    # the same 15-minute window however long ago the database was seeded
+    minutes = 15 + max(0, int((datetime.now(timezone.utc).replace(tzinfo=None) - newest).total_seconds() // 60))
+    return lambda: proximity_service.find_nearby(ctx.db, ctx.ds.user_id, ctx.ds.lat, ctx.ds.lng, 2000, minutes=minutes)
+
+
+# --- location_sessionService -----------------------------------------------
+
+@bench("session.all_sessions", 300)
+def _all_sessions(ctx):
+    from Services import location_sessionService
+    return lambda: location_sessionService.get_all_sessions(ctx.db, ctx.ds.session_user, limit=100)
+
+
+@bench("session.active_session", 500)
+def _active_session(ctx):
+    from Services import location_sessionService, session_registry
+    session_registry.load(ctx.db)
+    return lambda: location_sessionService.get_active_session(ctx.db, ctx.ds.session_user)
+
+
+@bench("session.start_end_cycle", 100, writes=True)
+def _start_end(ctx):
+    from Services import location_sessionService
+
+    def op():
+        session = location_sessionService.createLocationsession(ctx.db, ctx.ds.writer_id)
+        location_sessionService.end_session(ctx.db, ctx.ds.writer_id, session.id)
+    return op
+
+
+# --- trusted_contactsService -----------------------------------------------
+
+@bench("contacts.list", 500)
+def _contacts(ctx):
+    from Services import trusted_contactsService
+    return lambda: trusted_contactsService.get_contacts(ctx.db, ctx.ds.user_id)
+
+
+@bench("contacts.recipients_cold", 500)
+def _recipients_cold(ctx):
+    from Services import trusted_contactsService
+
+    def op():
+        trusted_contactsService.invalidate_recipients(ctx.ds.user_id)
+        return trusted_contactsService.get_contact_recipients(ctx.db, ctx.ds.user_id)
+    return op
+
+
+@bench("contacts.recipients_cached", 2000)
+def _recipients_cached(ctx):
+    from Services import trusted_contactsService
+    trusted_contactsService.get_contact_recipients(ctx.db, ctx.ds.user_id)
+    return lambda: trusted_contactsService.get_contact_recipients(ctx.db, ctx.ds.user_id)
+
+
+@bench("contacts.recipient_ids_async", 500)
+def _recipient_ids_async(ctx):
+    from Services import trusted_contactsService
+
+    async def op():
+        trusted_contactsService.invalidate_recipients(ctx.ds.user_id)
+        async with ctx.async_session() as db:
+            return await trusted_contactsService.get_accepted_contact_ids_async(db, ctx.ds.user_id)
+    return op
+
+
+# --- user_service / auth_service -------------------------------------------
+
+@bench("user.get_async", 500)
+def _get_user(ctx):
+    from Services import user_service
+
+    async def op():
+        async with ctx.async_session() as db:
+            return await user_service.get_user_async(db, ctx.ds.user_id)
+    return op
+
+
+@bench("user.authenticate", 10)
+def _authenticate(ctx):
+    from Services import user_service
+
+    async def op():
+        async with ctx.async_session() as db:
+            assert await user_service.authenticate_user(ctx.ds.email, PASSWORD, db)
+    return op
+
+
+@bench("auth.create_token", 2000)
+def _create_token(ctx):
+    from Services import auth_service
+    return lambda: auth_service.create_access_token({"sub": ctx.ds.email, "id": ctx.ds.user_id})
+
+
+@bench("auth.decode_token_uncached", 2000)
+def _decode_uncached(ctx):
+    from Services import auth_service
+    from Services.token_cache import token_cache
+    token = auth_service.create_access_token({"sub": ctx.ds.email, "id": ctx.ds.user_id})
+
+    def op():
+        token_cache.clear()
+        return auth_service.decode_access_token(token)
+    return op
+
+
+@bench("auth.decode_token_cached", 5000)
+def _decode_cached(ctx):
+    from Services import auth_service
+    token = auth_service.create_access_token({"sub": ctx.ds.email, "id": ctx.ds.user_id})
+    return lambda: auth_service.decode_access_token(token)
+
+
+# --- macro: request-shaped sequences ---------------------------------------
+
+@bench("macro.replay_session", 20)
+def _replay_session(ctx):
+    from Services import locationService
+
+    def op():
+        cursor, points = None, 0
+        while True:
+            page = locationService.get_session_history(ctx.db, ctx.ds.session_id, limit=100, cursor=cursor)
+            points += len(page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return points
+    return op
+
+
+@bench("macro.location_update", 500, writes=True)
+def _location_update(ctx):
+    """Per-fix service work of the websocket handler, minus the socket."""
+    from Services import locationService, trusted_contactsService
+    from Services.trajectory_filter import TrajectoryFilter
+    track = TrajectoryFilter(min_distance_m=0, min_interval_s=0)
+    step = [0]
+
+    async def op():
+        step[0] += 1
+        lat = ctx.ds.lat + step[0] * 1e-4
+        track.accept(ctx.ds.writer_id, lat, ctx.ds.lng, 5.0)
+        async with ctx.async_session() as db:
+            await trusted_contactsService.get_accepted_contact_ids_async(db, ctx.ds.writer_id)
+            await locationService.save_locations_bulk_async(db, [{
+                "user_id": ctx.ds.writer_id, "latitude": lat, "longitude": ctx.ds.lng,
+                "accuracy": 5.0, "timestamp": datetime.now(timezone.utc),
+            }])
+    return op
+
+
+@bench("macro.login", 10)
+def _login(ctx):
+    from Services import auth_service, user_service
+
+    async def op():
+        async with ctx.async_session() as db:
+            user = await user_service.authenticate_user(ctx.ds.email, PASSWORD, db)
+        return auth_service.create_access_token({"sub": user.email, "id": user.id})
+    return op
+
+
+# --- runner -----------------------------------------------------------------
+
+class Context:
+    def __init__(self, ds, db, async_session):
+        self.ds = ds
+        self.db = db
+        self.async_session = async_session
+
+
+def _summary(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "iterations": len(samples),
+        "median_ms": round(statistics.median(ordered) * 1000, 4),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)] * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "ops_per_s": round(1 / statistics.fmean(ordered), 1),
+    }
+
+
+async def _time(op, iterations: int) -> list[float]:
+    is_async = asyncio.iscoroutinefunction(op)
+    samples = []
+    for i in range(iterations + max(1, iterations // 10)):
+        start = time.perf_counter()
+        if is_async:
+            await op()
+        else:
+            op()
+        elapsed = time.perf_counter() - start
+        # the first ~10% warm caches and connections and are not recorded
+        if i >= max(1, iterations // 10):
+            samples.append(elapsed)
+    return samples
+
+
+async def run(ds, selected, scale_iterations: float) -> dict:
+    from Database.database import SessionLocal, AsyncSessionLocal, async_engine
+
+    results = {}
+    db = SessionLocal()
+    try:
+        ctx = Context(ds, db, AsyncSessionLocal)
+        for name, iterations, _, factory in selected:
+            op = factory(ctx)
+            samples = await _time(op, max(3, int(iterations * scale_iterations)))
+            db.rollback()
+            results[name] = _summary(samples)
+            r = results[name]
+            print(f"{name:<32}{r['median_ms']:>12.3f}{r['p95_ms']:>12.3f}{r['ops_per_s']:>12.1f}")
+    finally:
+        db.close()
+        await async_engine.dispose()
+    return results
+
+
+def compare(results: dict, baseline: dict, max_regression: float | None) -> list[str]:
+    """Print median deltas against a baseline; return the benchmarks over the threshold."""
+    regressions = []
+    print(f"\n{'benchmark':<32}{'baseline ms':>12}{'now ms':>12}{'delta':>10}")
+    for name, r in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            print(f"{name:<32}{'-':>12}{r['median_ms']:>12.3f}{'new':>10}")
+            continue
+        delta = (r["median_ms"] - base["median_ms"]) / base["median_ms"] * 100 if base["median_ms"] else 0.0
+        flag = ""
+        if max_regression is not None and delta > max_regression:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<32}{base['median_ms']:>12.3f}{r['median_ms']:>12.3f}{delta:>+9.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=SCALES, default="1k", help="number of seeded location rows")
+    parser.add_argument("--database-url", help="defaults to a per-scale SQLite file in the temp directory")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--iterations", type=float, default=1.0, help="multiply every benchmark's iteration count")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, help="exit non-zero if a median is this many percent slower")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url or _default_url(args.scale)
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-32-bytes-long")
+
+    from Database.database import Base, engine
+    from Database import migrations
+    from Models import user, trusted_contacts, location_sessions, location, session_archive  # noqa: F401
+    from Services.auth_service import _hashpw
+
+    Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+
+    ds = Dataset(SCALES[args.scale])
+    # an interrupted run may have left benchmark writes behind
+    cleanup(engine, ds)
+    started = time.perf_counter()
+    if seed(engine, ds, _hashpw(PASSWORD)):
+        print(f"[Bench] Seeded {args.scale} dataset in {time.perf_counter() - started:.1f}s")
+
+    selected = sorted((b for b in BENCHMARKS if args.filter in b[0]), key=lambda b: b[2])
+    print(f"{'benchmark':<32}{'median ms':>12}{'p95 ms':>12}{'ops/s':>12}")
+    try:
+        results = asyncio.run(run(ds, selected, args.iterations))
+    finally:
+        cleanup(engine, ds)
+
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "rows": ds.rows,
+            "database": engine.dialect.name,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("scale") != args.scale:
+            print(f"[Bench] Baseline was recorded at scale {baseline.get('meta', {}).get('scale')}, not {args.scale}")
+        if compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
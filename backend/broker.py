@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import json
+import os
+from typing import Callable, Iterable
+from urllib.parse import urlparse
+from Services.app_logging import get_logger
+
+# Where the networked broker listens, e.g. tcp://127.0.0.1:7070 or
+# unix:///tmp/safety-broker.sock. Leave unset to route in-process only.
+BROKER_URL = os.getenv("BROKER_URL")
+RECONNECT_DELAY = float(os.getenv("BROKER_RECONNECT_DELAY", "1"))
+
+log = get_logger("broker")
+
+# Frames are newline-delimited JSON objects:
+#   client -> broker  {"op": "sub" | "unsub", "ch": [channel, ...]}
+#                     {"op": "pub", "ch": [channel, ...], "msg": {...}}
+#   broker -> client  {"ch": [channel, ...], "msg": {...}}
+# A published message reaches each client once, listing every channel of
+# that client it matched, and is handed to the handler as one object.
+_LINE_LIMIT = 1 << 20
+# a subscriber with more than this many bytes unsent is disconnected
+_MAX_CLIENT_BUFFER = 8 << 20
+
+Handler = Callable[[str, dict], None]
+
+
+class Broker:
+    """Pub/sub interface used by the connection manager for fan-out.
+
+    ``publish`` and the subscription calls never block, so they can be used
+    from the websocket handler directly; deliveries are passed to ``handler``.
+    """
+
+    def __init__(self, handler: Handler):
+        self.handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, channels: Iterable[str], message: dict):
+        raise NotImplementedError
+
+    def subscribe(self, channel: str):
+        raise NotImplementedError
+
+    def unsubscribe(self, channel: str):
+        raise NotImplementedError
+
+
+class InProcessBroker(Broker):
+    """Delivers straight to local subscribers. Used when running one worker."""
+
+    def __init__(self, handler: Handler):
+        super().__init__(handler)
+        self._channels: set[str] = set()
+
+    def publish(self, channels: Iterable[str], message: dict):
+        for ch in channels:
+            if ch in self._channels:
+                self.handler(ch, message)
+
+    def subscribe(self, channel: str):
+        self._channels.add(channel)
+
+    def unsubscribe(self, channel: str):
+        self._channels.discard(channel)
+
+
+class SocketBroker(Broker):
+    """Client for the broker server below, over TCP or a Unix socket.
+
+    Every worker publishes to the broker and subscribes only to the channels
+    of its locally connected users. Subscriptions are replayed after a
+    reconnect. While disconnected, published frames still reach this
+    worker's own subscribers directly; only the copies for other workers
+    are dropped.
+    """
+
+    def __init__(self, handler: Handler, url: str):
+        super().__init__(handler)
+        self.url = url
+        self._channels: set[str] = set()
+        self._writer: asyncio.StreamWriter | None = None
+        self._task: asyncio.Task | None = None
+        self._connected = asyncio.Event()
+        self.dropped = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._connected.wait(), RECONNECT_DELAY * 5)
+        except asyncio.TimeoutError:
+            log.warning("broker not reachable yet, retrying in background", url=self.url)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._writer:
+            self._writer.close()
+
+    def publish(self, channels: Iterable[str], message: dict):
+        channels = list(channels)
+        if not channels:
+            return
+        if not self._linked():
+            # the broker would have echoed these back to us; deliver them here
+            for ch in channels:
+                if ch in self._channels:
+                    self.handler(ch, message)
+        self._send({"op": "pub", "ch": channels, "msg": message})
+
+    def _linked(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    def subscribe(self, channel: str):
+        if channel not in self._channels:
+            self._channels.add(channel)
+            self._send({"op": "sub", "ch": [channel]})
+
+    def unsubscribe(self, channel: str):
+        if channel in self._channels:
+            self._channels.discard(channel)
+            self._send({"op": "unsub", "ch": [channel]})
+
+    def _send(self, frame: dict):
+        if not self._linked():
+            self.dropped += 1
+            return
+        self._writer.write(json.dumps(frame, separators=(",", ":")).encode() + b"\n")
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await _open_connection(self.url)
+            except OSError as e:
+                log.warning("connect failed", url=self.url, error=str(e))
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            self._writer = writer
+            if self._channels:
+                self._send({"op": "sub", "ch": sorted(self._channels)})
+            self._connected.set()
+            try:
+                while line := await reader.readline():
+                    frame = json.loads(line)
+                    channels = frame["ch"]
+                    for ch in [channels] if isinstance(channels, str) else channels:
+                        self.handler(ch, frame["msg"])
+            except (OSError, ValueError, KeyError) as e:
+                log.warning("connection lost", url=self.url, error=str(e))
+            finally:
+                self._connected.clear()
+                self._writer = None
+                writer.close()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+def create_broker(handler: Handler, url: str | None = BROKER_URL) -> Broker:
+    if not url:
+        return InProcessBroker(handler)
+    return SocketBroker(handler, url)
+
+
+async def _open_connection(url: str):
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return await asyncio.open_unix_connection(parsed.path, limit=_LINE_LIMIT)
+    if parsed.scheme == "tcp":
+        return await asyncio.open_connection(parsed.hostname, parsed.port, limit=_LINE_LIMIT)
+    raise ValueError(f"Unsupported broker URL: {url}")
+
+
+class BrokerServer:
+    """Minimal relay that routes published frames to subscribed clients.
+
+    It keeps no history and does no persistence; it is the networked
+    backend for running several workers, and a local stand-in for tests.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[str, set[asyncio.StreamWriter]] = {}
+
+    async def serve(self, url: str):
+        parsed = urlparse(url)
+        if parsed.scheme == "unix":
+            if os.path.exists(parsed.path):
+                os.unlink(parsed.path)
+            server = await asyncio.start_unix_server(self._handle, parsed.path, limit=_LINE_LIMIT)
+        elif parsed.scheme == "tcp":
+            server = await asyncio.start_server(self._handle, parsed.hostname, parsed.port, limit=_LINE_LIMIT)
+        else:
+            raise ValueError(f"Unsupported broker URL: {url}")
+        log.info("listening", url=url)
+        return server
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscribed: set[str] = set()
+        try:
+            while line := await reader.readline():
+                frame = json.loads(line)
+                op = frame.get("op")
+                if op == "pub":
+                    self._route(frame["ch"], frame["msg"])
+                elif op == "sub":
+                    for ch in frame["ch"]:
+                        self._subscribers.setdefault(ch, set()).add(writer)
+                        subscribed.add(ch)
+                elif op == "unsub":
+                    for ch in frame["ch"]:
+                        self._remove(ch, writer)
+                        subscribed.discard(ch)
+        except (OSError, ValueError, KeyError):
+            pass
+        finally:
+            for ch in subscribed:
+                self._remove(ch, writer)
+            writer.close()
+
+    def _route(self, channels: list[str], message: dict):
+        # group by subscriber so each worker gets (and parses) one line per publish
+        targets: dict[asyncio.StreamWriter, list[str]] = {}
+        for ch in channels:
+            for w in self._subscribers.get(ch, ()):
+                targets.setdefault(w, []).append(ch)
+        if not targets:
+            return
+        # the message is serialized once; only the channel list differs
+        body = json.dumps(message, separators=(",", ":"))
+        for w, matched in targets.items():
+            if w.is_closing():
+                continue
+            if w.transport.get_write_buffer_size() > _MAX_CLIENT_BUFFER:
+                # a worker that stopped reading; its reconnect resubscribes it
+                w.close()
+                continue
+            w.write(f'{{"ch":{json.dumps(matched)},"msg":{body}}}\n'.encode())
+
+    def _remove(self, channel: str, writer: asyncio.StreamWriter):
+        writers = self._subscribers.get(channel)
+        if writers is not None:
+            writers.discard(writer)
+            if not writers:
+                del self._subscribers[channel]
+
+
+async def _serve_forever(url: str):
+    server = await BrokerServer().serve(url)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the websocket fan-out broker")
+    parser.add_argument("--listen", default=BROKER_URL or "tcp://127.0.0.1:7070")
+    args = parser.parse_args()
+    asyncio.run(_serve_forever(args.listen))
@@ -0,0 +1,258 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Callable, Iterable
+from fastapi import WebSocket
+from broker import BROKER_URL, Broker, InProcessBroker, create_broker
+from Services import invalidation, metrics
+from Services.app_logging import get_logger
+from Services.invalidation import INVALIDATE_CHANNEL
+from track_hub import TRACK_PREFIX, TrackHub, track_channel
+import ws_protocol
+from ws_protocol import Frame
+
+# Outbound frames a viewer may have waiting before it is considered stuck.
+SEND_QUEUE_MAX = int(os.getenv("WS_SEND_QUEUE_MAX", "256"))
+# Longest a single send may block before the viewer is considered stuck.
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# close code sent to consumers dropped for falling behind ("try again later")
+STUCK_CLOSE_CODE = 1013
+
+# broker channel names: one per watcher, plus one every worker listens on
+ALL_CHANNEL = "all"
+
+
+log = get_logger("ws")
+
+FANOUT_SIZE = metrics.Histogram(
+    "ws_fanout_recipients", "Recipients per broadcast", buckets=metrics.SIZE_BUCKETS)
+SEND_SECONDS = metrics.Histogram("ws_send_seconds", "Time to write one frame to a websocket")
+SENT_BYTES = metrics.Counter("ws_sent_bytes_total", "Encoded frame bytes written, before compression", ("codec",))
+CONFLATED = metrics.Counter("ws_conflated_total", "location_update frames replaced by a newer fix before sending")
+DROPPED = metrics.Counter("ws_dropped_connections_total", "Connections closed for falling behind", ("reason",))
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+class _LatestFix:
+    """Queue slot for a location_update; resolved to the newest fix on send."""
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+
+class Connection:
+    """One websocket plus its outbound queue and writer task.
+
+    ``send`` never blocks: frames are queued and written by a dedicated task,
+    so a slow viewer only delays itself. Pending ``location_update`` frames
+    from the same sender are conflated, keeping only the latest position.
+    Frames are written in the connection's negotiated ``codec``.
+    """
+
+    def __init__(self, user_id: int, websocket: WebSocket, on_drop: Callable[["Connection"], None] | None = None,
+                 max_pending: int = SEND_QUEUE_MAX, send_timeout: float = SEND_TIMEOUT,
+                 codec: str = ws_protocol.JSON):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.codec = codec
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.closed = False
+        self.conflated = 0
+        self._on_drop = on_drop
+        self._pending: deque = deque()
+        self._latest: dict = {}
+        self._ready = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._writer())
+
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def send(self, message: dict | Frame) -> bool:
+        """Queue a frame for this connection. Returns False if it was not queued."""
+        if self.closed:
+            return False
+
+        frame = message if isinstance(message, Frame) else Frame(message)
+        if frame.message.get("type") == "location_update":
+            key = frame.message.get("id")
+            if key in self._latest:
+                # an older fix from this sender is still waiting; overwrite it in place
+                self._latest[key] = frame
+                self.conflated += 1
+                CONFLATED.inc()
+                return True
+            self._latest[key] = frame
+            self._pending.append(_LatestFix(key))
+        else:
+            self._pending.append(frame)
+
+        if len(self._pending) > self.max_pending:
+            self._drop(f"{len(self._pending)} frames pending", "queue_full")
+            return False
+        self._ready.set()
+        return True
+
+    async def close(self):
+        self.closed = True
+        self._ready.set()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                if not self._pending:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                item = self._pending.popleft()
+                if isinstance(item, _LatestFix):
+                    item = self._latest.pop(item.key)
+                data = item.encode(self.codec)
+                started = time.perf_counter()
+                if isinstance(data, bytes):
+                    await asyncio.wait_for(self.websocket.send_bytes(data), self.send_timeout)
+                else:
+                    await asyncio.wait_for(self.websocket.send_text(data), self.send_timeout)
+                SEND_SECONDS.observe(time.perf_counter() - started)
+                SENT_BYTES.inc(len(data), codec=self.codec)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._drop(f"send blocked for more than {self.send_timeout}s", "send_timeout")
+        except Exception as e:
+            self._drop(f"send failed: {e}", "send_error")
+
+    def _drop(self, reason: str, kind: str):
+        if self.closed:
+            return
+        log.warning("dropping slow connection", user_id=self.user_id, reason=reason)
+        DROPPED.inc(reason=kind)
+        self.closed = True
+        self._ready.set()
+        self._pending.clear()
+        self._latest.clear()
+        if self._on_drop:
+            self._on_drop(self)
+        # closing ends the handler's receive loop; don't let a dead peer hold it up
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=STUCK_CLOSE_CODE), self.send_timeout)
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    """Connected users keyed by user id, with non-blocking fan-out.
+
+    Fan-out goes through a broker so that watchers connected to other
+    workers are reached too. Each worker subscribes only to the channels of
+    the users connected to it and delivers incoming frames to their queues.
+    Frames on ``track:`` channels go to the public tracking feed, if any,
+    and cache invalidations from other workers are applied here too.
+    """
+
+    def __init__(self, tracks: TrackHub | None = None):
+        self._connections: dict[int, Connection] = {}
+        self.tracks = tracks
+        # brokers hand the same message object to every channel of one publish;
+        # wrapping it once lets all recipients share the encoded bytes
+        self._last_message: dict | None = None
+        self._last_frame: Frame | None = None
+        self.broker: Broker = InProcessBroker(self._deliver)
+        self.broker.subscribe(ALL_CHANNEL)
+        self.broker.subscribe(INVALIDATE_CHANNEL)
+        if tracks is not None:
+            tracks.attach(self.broker)
+
+    async def start(self, broker_url: str | None = BROKER_URL):
+        """Switch to the networked broker at ``broker_url``, if one is configured."""
+        if not broker_url:
+            return
+        broker = create_broker(self._deliver, broker_url)
+        await broker.start()
+        broker.subscribe(ALL_CHANNEL)
+        broker.subscribe(INVALIDATE_CHANNEL)
+        for uid in self._connections:
+            broker.subscribe(user_channel(uid))
+        self.broker = broker
+        if self.tracks is not None:
+            self.tracks.attach(broker)
+
+    async def stop(self):
+        await self.broker.stop()
+
+    def connect(self, user_id: int, websocket: WebSocket, codec: str = ws_protocol.JSON) -> Connection:
+        conn = Connection(user_id, websocket, on_drop=self.disconnect, codec=codec)
+        conn.start()
+        self._connections[user_id] = conn
+        self.broker.subscribe(user_channel(user_id))
+        return conn
+
+    def disconnect(self, conn: Connection):
+        # a reconnect may already have replaced this entry
+        if self._connections.get(conn.user_id) is conn:
+            del self._connections[conn.user_id]
+            self.broker.unsubscribe(user_channel(conn.user_id))
+
+    def get(self, user_id: int) -> Connection | None:
+        return self._connections.get(user_id)
+
+    def send(self, user_id: int, message: dict):
+        self.broker.publish([user_channel(user_id)], message)
+
+    def broadcast(self, user_ids: Iterable[int], message: dict, track: int | None = None):
+        """Publish ``message`` to every user in ``user_ids``, wherever they are connected.
+
+        With ``track``, the same frame also goes to that user's public
+        tracking feed; it costs nothing extra when nobody is watching.
+        """
+        channels = [user_channel(uid) for uid in user_ids]
+        FANOUT_SIZE.observe(len(channels))
+        if track is not None:
+            channels.append(track_channel(track))
+        self.broker.publish(channels, message)
+
+    def send_all(self, message: dict):
+        self.broker.publish([ALL_CHANNEL], message)
+
+    def _deliver(self, channel: str, message: dict):
+        if channel.startswith(TRACK_PREFIX):
+            if self.tracks is not None:
+                self.tracks.deliver(channel, message)
+            return
+        if channel == INVALIDATE_CHANNEL:
+            invalidation.deliver(message)
+            return
+        if message is not self._last_message:
+            self._last_message = message
+            self._last_frame = Frame(message)
+        frame = self._last_frame
+        if channel == ALL_CHANNEL:
+            for conn in list(self._connections.values()):
+                conn.send(frame)
+            return
+        conn = self._connections.get(int(channel.split(":", 1)[1]))
+        if conn:
+            conn.send(frame)
+
+    def __len__(self):
+        return len(self._connections)
+
+    def __contains__(self, user_id):
+        return user_id in self._connections
@@ -1,42 +1,113 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, Depends, HTTPException
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
 
-from Controllers.fake_call import router as fake_call_router
-from Controllers import trusted_contactsController, location_sessionController
+from Controllers.fake_call import router as fake_call_router, warm_audio_cache, open_tts_client, close_tts_client
+from Controllers import trusted_contactsController, location_sessionController, locationController
 from Controllers.auth import router as auth_router
+from Controllers.metricsController import router as metrics_router
+from Controllers.trackController import router as track_router
 from Services import location_sessionService, trusted_contactsService
-from Services import locationService
-from Services.auth_service import decode_access_token
-from twilio_service import send_emergency_sms, send_location_share_sms
-from Models.user import User
+from Services import locationService, user_service
+from Services.location_writer import location_writer
+from Services import session_registry
+from Services.trajectory_filter import trajectory_filter
+from Services import archive_service
+from Services import invalidation
+from Services.invalidation import INVALIDATE_CHANNEL
+from Services.auth_service import decode_access_token, require_user, require_self
+from Services.hashing_pool import hashing_pool
+from Services.token_cache import token_cache
+from Services import metrics
+from Services import app_logging
+from Services.admission import (
+    admission, rate_limiter, NEVER_SHED, OVERLOADED_CLOSE_CODE, ADMIT_MAX_WRITER_QUEUE, ADMIT_MAX_NOTIFY_QUEUE,
+)
+from twilio_service import emergency_message, location_share_message
+from notification_outbox import outbox
+from connection_manager import ConnectionManager
+from track_hub import track_hub
+import ws_protocol
 from dotenv import load_dotenv
-from typing import Dict
+from contextlib import asynccontextmanager
+import asyncio
 import os
-from Database.database import SessionLocal
+from Database.database import SessionLocal, AsyncSessionLocal, async_engine, get_async_db
+from Schemas.locationsSchema import LocationBatch, LocationBatchResult
 
 # Load environment variables
 load_dotenv()
 
+log = app_logging.get_logger("ws")
+# one record per received message; sampled, see LOG_SAMPLE
+message_log = app_logging.get_logger("ws.message")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # rebuild the active-session map before accepting any traffic
+    db = SessionLocal()
+    try:
+        session_registry.load(db)
+    finally:
+        db.close()
+    # background writer that batches location_update rows into bulk inserts
+    location_writer.start()
+    # worker pool that sends SMS/WhatsApp messages off the event loop
+    outbox.start()
+    # connect fan-out to the shared broker when BROKER_URL is set
+    await clients.start()
+    # cache invalidations reach the other workers through the same broker;
+    # sync endpoints run in threads, so hop onto the loop to publish
+    loop = asyncio.get_running_loop()
+    invalidation.connect(lambda message: loop.call_soon_threadsafe(
+        lambda: clients.broker.publish([INVALIDATE_CHANNEL], message)))
+    # pooled HTTP client shared by every text-to-speech call
+    open_tts_client()
+    # optionally pre-render fake-call audio in the background
+    warm_task = asyncio.create_task(warm_audio_cache()) if os.getenv("TTS_WARM_ON_STARTUP") == "1" else None
+    # archive ended sessions and purge old raw points when RETENTION_ENABLED=1
+    retention_task = asyncio.create_task(archive_service.run_retention_loop()) if archive_service.RETENTION_ENABLED else None
+    yield
+    if warm_task:
+        warm_task.cancel()
+    if retention_task:
+        retention_task.cancel()
+    await close_tts_client()
+    invalidation.connect(None)
+    await clients.stop()
+    await outbox.stop()
+    # flush whatever is still queued before the process exits
+    await location_writer.stop()
+    await async_engine.dispose()
+
+
 # Create FastAPI instance
-app = FastAPI(title="Public Safety App")
+app = FastAPI(title="Public Safety App", lifespan=lifespan)
 
 from Database.database import engine, Base
+from Database import migrations
 
 # import ALL models so SQLAlchemy knows about them
 from Models import user
 from Models import trusted_contacts
 from Models import location_sessions
 from Models import location
+from Models import session_archive
 
 # Create tables in the DB if they don't exist
 Base.metadata.create_all(bind=engine)
+# then bring existing tables up to date (new columns and indexes)
+migrations.upgrade(engine)
 
 # Include authentication routes
 app.include_router(auth_router)
 app.include_router(trusted_contactsController.router)
 app.include_router(location_sessionController.router)
+app.include_router(locationController.router)
 app.include_router(fake_call_router)
+app.include_router(metrics_router)
+app.include_router(track_router)
 
 # Enable CORS so frontend can communicate with backend
 origins = [
@@ -53,9 +124,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Dictionary to keep track of currently connected clients
-# maps authenticated user IDs to their websocket connection
-clients: Dict[int, WebSocket] = {}
+# Keeps track of currently connected clients
+# maps authenticated user IDs to their connection and its outbound queue;
+# also feeds the public tracking links
+clients = ConnectionManager(tracks=track_hub)
+
+MESSAGE_TYPES = ("start_session", "end_session", "location_update", "location_batch", "emergency_alert")
+WS_MESSAGE_SECONDS = metrics.Histogram("ws_message_seconds", "Websocket message handling time", ("type",))
+
+# process-wide numbers exported on /metrics
+metrics.instrument_engine(engine, "sync")
+metrics.instrument_engine(async_engine.sync_engine, "async")
+metrics.Gauge("ws_connected_sockets", "Websockets connected to this worker", fn=lambda: len(clients))
+metrics.Gauge("location_writer_queue_depth", "Location rows waiting for the next batch insert",
+              fn=location_writer.depth)
+metrics.Gauge("location_writer_rows_written", "Location rows inserted by the writer",
+              fn=lambda: location_writer.rows_written)
+metrics.Gauge("location_writer_rows_failed", "Location rows lost to failed batch inserts",
+              fn=lambda: location_writer.rows_failed)
+metrics.Gauge("location_writer_rows_rejected", "Location readings refused by the writer as invalid",
+              fn=lambda: location_writer.rows_rejected)
+metrics.Gauge("notify_queue_depth", "Messages waiting for an outbox worker", fn=outbox.depth)
+metrics.Gauge("notify_deliveries", "Outbox deliveries by outcome", ("outcome",), fn=lambda: dict(outbox.counts))
+metrics.stats_gauges("hashing_pool", "bcrypt hashing pool", hashing_pool.stats)
+metrics.stats_gauges("token_cache", "Verified JWT cache", token_cache.stats)
+metrics.stats_gauges("trajectory_filter", "Location fix filter", trajectory_filter.stats)
+metrics.stats_gauges("log", "Log queue", app_logging.stats)
+metrics.stats_gauges("admission", "Websocket admission control", admission.stats)
+metrics.stats_gauges("ws_rate_limiter", "Per-user websocket rate limits", rate_limiter.stats)
+
+# overload signals besides DB pool wait, which the admission module tracks itself
+admission.add_probe("location_writer_queue", location_writer.depth, ADMIT_MAX_WRITER_QUEUE)
+admission.add_probe("notify_queue", outbox.depth, ADMIT_MAX_NOTIFY_QUEUE)
 
 # Root endpoint to verify backend is running
 @app.get("/")
@@ -63,130 +163,201 @@ async def root():
     return {"message": "Backend is running!"}
 
 
-# Tracking page (for testing HTML map)
-@app.get("/track/{user_id}", response_class=HTMLResponse)
-async def tracking_page(user_id: str):
-    with open("track.html", "r") as f:
-        return f.read()
+async def save_location_batch(db: AsyncSession, user_id: int, batch: LocationBatch) -> LocationBatchResult:
+    """Store a replayed batch and send watchers its newest point plus a summarized trail."""
+    rows = await locationService.save_location_batch_async(db, user_id, batch.points)
+    if rows:
+        latest = rows[-1]
+        contact_ids = await trusted_contactsService.get_accepted_contact_ids_async(db, user_id)
+        # a location_update, so clients that ignore the trail still move the marker
+        clients.broadcast(contact_ids, {
+            "type": "location_update",
+            "id": user_id,
+            "lat": latest["latitude"],
+            "lng": latest["longitude"],
+            "timestamp": int(latest["timestamp"].timestamp() * 1000),
+            "trail": locationService.summarize_trail(rows),
+        }, track=user_id)
+    return LocationBatchResult(
+        received=len(batch.points),
+        stored=len(rows),
+        session_id=rows[-1]["session_id"] if rows else None,
+    )
+
+
+# Buffered fixes uploaded over HTTP, e.g. by a background sync after reconnecting
+@app.post("/users/{user_id}/locations/batch", response_model=LocationBatchResult)
+async def upload_location_batch(user_id: int, batch: LocationBatch, db: AsyncSession = Depends(get_async_db),
+                                claims: dict = Depends(require_user)):
+    # only the user themselves may add fixes; they are fanned out to contacts and the tracking page
+    require_self(user_id, claims)
+    if admission.shed("location_batch"):
+        # the client keeps its buffer and retries
+        raise HTTPException(status_code=503, detail="Server busy, retry later", headers={"Retry-After": "5"})
+    return await save_location_batch(db, user_id, batch)
 
 
 # WebSocket endpoint for location updates, session control and emergency alerts
 @app.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str, token: str = Query(None)):
+async def websocket_endpoint(websocket: WebSocket, client_id: str, token: str = Query(None),
+                             priority: str | None = Query(None)):
     # authenticate the connecting user
-    print(f"[WebSocket] Connection attempt from client_id={client_id}, token={'present' if token else 'missing'}")
+    log.debug("connection attempt", client_id=client_id, token=bool(token))
     payload = decode_access_token(token or "")
     if not payload or "id" not in payload:
-        print(f"[WebSocket] Auth failed for client_id={client_id}")
+        log.warning("auth failed", client_id=client_id)
         await websocket.close(code=1008)
         return
     user_id = payload["id"]
     if str(user_id) != client_id:
-        print(f"[WebSocket] Client ID mismatch: user_id={user_id}, client_id={client_id}")
+        log.warning("client id mismatch", user_id=user_id, client_id=client_id)
         await websocket.close(code=1008)
         return
+    # refuse while overloaded; an authenticated user with an alert to send
+    # reconnects with ?priority=emergency and is always let in
+    if not admission.admit_connection(priority):
+        await websocket.accept()
+        await websocket.close(code=OVERLOADED_CLOSE_CODE, reason="overloaded")
+        return
 
-    await websocket.accept()
-    print(f"[WebSocket] User {user_id} connected")
-    clients[user_id] = websocket
-
-    # create a database session for the lifetime of this connection
-    db = SessionLocal()
+    # JSON unless the client offers the binary subprotocol
+    codec, subprotocol = ws_protocol.negotiate(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    log.info("connected", user_id=user_id, codec=codec)
+    conn = clients.connect(user_id, websocket, codec)
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await ws_protocol.receive(websocket, codec)
             message_type = data.get("type")
-            print(f"[WebSocket] Received {message_type} from user {user_id}: {data}")
+            # type and sender only: payloads carry coordinates
+            message_log.info("received", type=message_type, user_id=user_id)
 
-            if message_type == "start_session":
-                session = location_sessionService.createLocationsession(db, user_id)
-                await websocket.send_json({"type": "session_started", "session_id": session.id})
+            # time the whole handler, per message type; unknown types share one label
+            label = message_type if message_type in MESSAGE_TYPES else "other"
+
+            verdict = rate_limiter.acquire(user_id, label)
+            if not verdict.allowed and message_type not in NEVER_SHED:
+                if verdict.notify:
+                    # once per burst, so a runaway client doesn't double its own traffic
+                    conn.send({"type": "rate_limited", "message_type": message_type,
+                               "retry_after": round(verdict.retry_after, 2)})
+                continue
+            if admission.shed(label):
+                if message_type == "location_batch":
+                    conn.send({"type": "location_batch_ack", "error": "overloaded", "retry_after": 5})
+                continue
+            with WS_MESSAGE_SECONDS.time(type=label):
+                # a session per message: connections are only held while a message is handled
+                async with AsyncSessionLocal() as db:
+                    if message_type == "start_session":
+                        session = await location_sessionService.createLocationsession_async(db, user_id)
+                        trajectory_filter.reset(user_id)
+                        conn.send({"type": "session_started", "session_id": session.id})
                 
-                # Get user details for SMS
-                user = db.query(User).filter(User.id == user_id).first()
+                        # Get user details for SMS
+                        user = await user_service.get_user_async(db, user_id)
                 
-                # Notify contacts that user began sharing
-                contact_ids = trusted_contactsService.get_accepted_contact_ids(db, user_id)
-                for cid in contact_ids:
-                    # WebSocket notification
-                    ws = clients.get(cid)
-                    if ws:
-                        await ws.send_json({"type": "contact_started", "user_id": user_id})
-                    
-                    # Send SMS with location tracking link
-                    contact = db.query(User).filter(User.id == cid).first()
-                    if contact and contact.phone:
-                        send_location_share_sms(
-                            to_number=contact.phone,
-                            user_name=user.username,
-                            user_id=user_id
-                        )
-
-            elif message_type == "end_session":
-                sid = data.get("session_id")
-                if sid is not None:
-                    location_sessionService.end_session(db, user_id, sid)
-                await websocket.send_json({"type": "session_ended", "session_id": sid})
-                contact_ids = trusted_contactsService.get_accepted_contact_ids(db, user_id)
-                for cid in contact_ids:
-                    ws = clients.get(cid)
-                    if ws:
-                        await ws.send_json({"type": "contact_ended", "user_id": user_id})
-
-            elif message_type == "location_update":
-                lat = data.get("lat")
-                lng = data.get("lng")
-                acc = data.get("accuracy")
-                # persist the reading
-                try:
-                    locationService.save_location(db, user_id, lat, lng, acc)
-                except Exception as e:
-                    print(f"Error saving location: {e}")
-                # only forward to accepted contacts
-                contact_ids = trusted_contactsService.get_accepted_contact_ids(db, user_id)
-                for cid in contact_ids:
-                    ws = clients.get(cid)
-                    if ws:
-                        await ws.send_json({
+                        # Notify contacts that user began sharing
+                        recipients = await trusted_contactsService.get_contact_recipients_async(db, user_id)
+                        # WebSocket notification
+                        clients.broadcast((c.id for c in recipients), {"type": "contact_started", "user_id": user_id},
+                                         track=user_id)
+                        for contact in recipients:
+                            # Send SMS with location tracking link
+                            if contact.phone:
+                                outbox.enqueue(location_share_message(
+                                    to_number=contact.phone,
+                                    user_name=user.username,
+                                    user_id=user_id
+                                ))
+
+                    elif message_type == "end_session":
+                        sid = data.get("session_id")
+                        if sid is not None:
+                            await location_sessionService.end_session_async(db, user_id, sid)
+                        conn.send({"type": "session_ended", "session_id": sid})
+                        contact_ids = await trusted_contactsService.get_accepted_contact_ids_async(db, user_id)
+                        clients.broadcast(contact_ids, {"type": "contact_ended", "user_id": user_id}, track=user_id)
+
+                    elif message_type == "location_update":
+                        lat = data.get("lat")
+                        lng = data.get("lng")
+                        acc = data.get("accuracy")
+                        # drop jitter, inaccurate and redundant fixes before storing or forwarding
+                        if not trajectory_filter.accept(user_id, lat, lng, acc):
+                            continue
+                        # queue the reading; the writer persists it in the next batch
+                        if not await location_writer.enqueue(user_id, lat, lng, acc):
+                            continue
+                        # forward to accepted contacts and to anyone holding a tracking link
+                        contact_ids = await trusted_contactsService.get_accepted_contact_ids_async(db, user_id)
+                        clients.broadcast(contact_ids, {
                             "type": "location_update",
                             "id": user_id,
                             "lat": lat,
                             "lng": lng,
-                        })
+                        }, track=user_id)
 
-            elif message_type == "emergency_alert":
-                user = db.query(User).filter(User.id == user_id).first()
-                lat = data.get("lat")
-                lng = data.get("lng")
-                
-                # For testing: send emergency alert to user's own phone number
-                if user and user.phone:
-                    send_emergency_sms(
-                        to_number=user.phone,
-                        user_name=user.username,
-                        lat=lat,
-                        lng=lng,
-                        user_id=user_id,
-                    )
+                    elif message_type == "location_batch":
+                        # fixes buffered while offline: one insert and one broadcast for the lot
+                        try:
+                            batch = LocationBatch.model_validate(data)
+                        except ValidationError as e:
+                            conn.send({
+                                "type": "location_batch_ack",
+                                "error": "invalid location_batch",
+                                "detail": e.errors(include_url=False, include_context=False, include_input=False),
+                            })
+                            continue
+                        result = await save_location_batch(db, user_id, batch)
+                        conn.send({"type": "location_batch_ack", **result.model_dump()})
+
+                    elif message_type == "emergency_alert":
+                        user = await user_service.get_user_async(db, user_id)
+                        lat = data.get("lat")
+                        lng = data.get("lng")
+                        # flag the alert on the tracking page before the messages go out
+                        clients.broadcast((), {"type": "emergency_alert", "user_id": user_id, "lat": lat, "lng": lng},
+                                          track=user_id)
+
+                        # repeats past the rate limit still go out; the outbox
+                        # merges them with any message to the same number not yet sent
+                        # For testing: send emergency alert to user's own phone number
+                        if user and user.phone:
+                            outbox.enqueue(emergency_message(
+                                to_number=user.phone,
+                                user_name=user.username,
+                                user_id=user_id,
+                            ))
                 
-                # Also send to all accepted trusted contacts
-                contact_ids = trusted_contactsService.get_accepted_contact_ids(db, user_id)
-                for cid in contact_ids:
-                    contact = db.query(User).filter(User.id == cid).first()
-                    if contact and contact.phone:
-                        send_emergency_sms(
-                            to_number=contact.phone,
-                            user_name=user.username,
-                            lat=lat,
-                            lng=lng,
-                            user_id=user_id,
-                        )
+                        # Also send to all accepted trusted contacts
+                        recipients = await trusted_contactsService.get_contact_recipients_async(db, user_id)
+                        for contact in recipients:
+                            if contact.phone:
+                                outbox.enqueue(emergency_message(
+                                    to_number=contact.phone,
+                                    user_name=user.username,
+                                    user_id=user_id,
+                                ))
 
     except WebSocketDisconnect:
-        if user_id in clients:
-            del clients[user_id]
-        for ws in clients.values():
-            await ws.send_json({"id": user_id, "left": True})
+        clients.disconnect(conn)
+        clients.send_all({"id": user_id, "left": True})
     finally:
-        db.close()
\ No newline at end of file
+        clients.disconnect(conn)
+        trajectory_filter.reset(user_id)
+        # rate buckets outlive the socket, so reconnecting doesn't refill them
+        await conn.close()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    # permessage-deflate is offered to clients that ask for it; WS_DEFLATE=0
+    # turns it off when CPU matters more than bandwidth
+    uvicorn.run(
+        app,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        ws_per_message_deflate=os.getenv("WS_DEFLATE", "1") == "1",
+    )
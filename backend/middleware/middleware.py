@@ -1,10 +1,13 @@
 from fastapi import Request, status
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Receive, Scope, Send
+from urllib.parse import parse_qs
 import jwt
 import os
 import logging
+from Services.token_cache import token_cache
+from Services.auth_service import TRACK_SCOPE
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +21,12 @@ PUBLIC_ROUTES = {
 }
 
 WS_PREFIX = "/ws/"
+# Public tracking pages and feeds; they check the link's share token themselves
+TRACK_PREFIX = "/track/"
+
+
+def _is_public(path: str) -> bool:
+    return path in PUBLIC_ROUTES or path.startswith(TRACK_PREFIX)
 
 
 class JWTMiddleware(BaseHTTPMiddleware):
@@ -33,7 +42,7 @@ class JWTMiddleware(BaseHTTPMiddleware):
         path = request.url.path
 
         # Skip auth for public routes
-        if path in PUBLIC_ROUTES:
+        if _is_public(path):
             return await call_next(request)
 
         # ws: token passed as ?token= query param
@@ -75,11 +84,98 @@ class JWTMiddleware(BaseHTTPMiddleware):
         return await call_next(request)
 
     def _decode_token(self, token: str) -> dict | None:
-        try:
-            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
-            return payload
-        except jwt.ExpiredSignatureError:
-            logger.warning("JWT token has expired")
-        except jwt.InvalidTokenError as e:
-            logger.warning(f"JWT token is invalid: {e}")
-        return None
\ No newline at end of file
+        return _decode_token(token, self.secret_key, self.algorithm)
+
+
+class JWTASGIMiddleware:
+    """Pure ASGI version of ``JWTMiddleware``.
+
+    Same public routes (including ``TRACK_PREFIX``) and ``?token=`` handling, without BaseHTTPMiddleware's
+    per-request task and response streaming wrapper. It also authenticates
+    ``websocket`` scopes, closing them with 1008 before accept when the token
+    is missing or invalid. Claims are stored in ``scope["state"]["user"]``,
+    which Starlette exposes as ``request.state.user``.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.secret_key = os.getenv("JWT_SECRET_KEY")
+        self.algorithm = os.getenv("JWT_ALGORITHM", "HS256")
+
+        if not self.secret_key:
+            raise RuntimeError("JWT_SECRET_KEY not set")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        scope_type = scope["type"]
+        if scope_type not in ("http", "websocket") or _is_public(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        # ws: token passed as ?token= query param
+        if scope_type == "websocket" or scope["path"].startswith(WS_PREFIX):
+            token = _query_token(scope)
+            missing = "Missing Token"
+            www_authenticate = None
+        else:
+            token = _bearer_token(scope)
+            missing = "Missing Authorization Header"
+            www_authenticate = "Bearer"
+
+        if not token:
+            await self._reject(scope, receive, send, missing, www_authenticate)
+            return
+
+        payload = _decode_token(token, self.secret_key, self.algorithm)
+        if payload is None:
+            await self._reject(scope, receive, send, "Invalid or expired Token", www_authenticate)
+            return
+
+        scope.setdefault("state", {})["user"] = payload
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, detail: str, www_authenticate: str | None):
+        if scope["type"] == "websocket":
+            # policy violation, sent before the handshake is accepted
+            await send({"type": "websocket.close", "code": 1008, "reason": detail})
+            return
+        headers = {"WWW-Authenticate": www_authenticate} if www_authenticate else None
+        response = JSONResponse(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            content={"detail": detail},
+            headers=headers,
+        )
+        await response(scope, receive, send)
+
+
+def _query_token(scope: Scope) -> str | None:
+    query = scope.get("query_string", b"")
+    if b"token=" not in query:
+        return None
+    values = parse_qs(query.decode("latin-1")).get("token")
+    return values[0] if values else None
+
+
+def _bearer_token(scope: Scope) -> str | None:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            value = value.decode("latin-1")
+            if value.startswith("Bearer "):
+                return value.split(" ", 1)[1]
+            return None
+    return None
+
+
+def _decode_token(token: str, secret_key: str, algorithm: str) -> dict | None:
+    try:
+        payload = token_cache.decode(token, secret_key, algorithm)
+        if payload.get("scope") == TRACK_SCOPE:
+            # a tracking-link token only opens TRACK_PREFIX routes
+            logger.warning("share token used outside the tracking routes")
+            return None
+        return payload
+    except jwt.ExpiredSignatureError:
+        logger.warning("JWT token has expired")
+    except jwt.InvalidTokenError as e:
+        logger.warning(f"JWT token is invalid: {e}")
+    return None
\ No newline at end of file
@@ -0,0 +1,242 @@
+import asyncio
+import itertools
+import os
+import random
+import time
+from collections import OrderedDict
+from twilio_service import OutboundMessage, TwilioTransport
+from Services import metrics
+from Services.app_logging import get_logger, redact_phone
+
+# Concurrent sends in flight; each one holds a thread for the HTTPS call.
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "8"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "4"))
+NOTIFY_BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", "0.5"))
+NOTIFY_BACKOFF_MAX = float(os.getenv("NOTIFY_BACKOFF_MAX", "30"))
+NOTIFY_QUEUE_MAX = int(os.getenv("NOTIFY_QUEUE_MAX", "10000"))
+# How many finished deliveries to keep for status lookups.
+NOTIFY_HISTORY = int(os.getenv("NOTIFY_HISTORY", "1000"))
+# "twilio" or "fake"; the fake transport records messages instead of sending.
+NOTIFY_TRANSPORT = os.getenv("NOTIFY_TRANSPORT", "twilio")
+
+# Kinds sent before anything else and never refused for a full queue;
+# NOTIFY_QUEUE_MAX only bounds the others.
+PRIORITY_KINDS = frozenset({"emergency"})
+# Kinds where a newer message about the same user to the same number
+# replaces one still waiting to go out, so repeated alerts reach each contact
+# once, never zero times. Alerts from different users are never merged.
+COALESCE_KINDS = frozenset({"emergency"})
+
+
+log = get_logger("outbox")
+
+SEND_SECONDS = metrics.Histogram(
+    "notify_send_seconds", "Duration of one transport (Twilio) send attempt", ("kind", "outcome"))
+
+
+class FakeTransport:
+    """Stand-in for Twilio that keeps every message it is asked to send.
+
+    ``fail_times`` makes the first N sends raise, to exercise retries.
+    """
+
+    def __init__(self, fail_times: int = 0, delay: float = 0.0):
+        self.sent: list[OutboundMessage] = []
+        self.fail_times = fail_times
+        self.delay = delay
+        self._counter = itertools.count(1)
+
+    def send(self, message: OutboundMessage) -> str:
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError("fake transport failure")
+        self.sent.append(message)
+        return f"FAKE{next(self._counter)}"
+
+
+class Delivery:
+    __slots__ = ("id", "message", "status", "attempts", "sid", "error", "created_at", "updated_at")
+
+    def __init__(self, id: int, message: OutboundMessage):
+        self.id = id
+        self.message = message
+        self.status = "queued"
+        self.attempts = 0
+        self.sid = None
+        self.error = None
+        self.created_at = self.updated_at = time.time()
+
+    def _set(self, status: str, error: str | None = None):
+        self.status = status
+        self.error = error
+        self.updated_at = time.time()
+
+
+class NotificationOutbox:
+    """Queue of outbound SMS/WhatsApp messages sent by a bounded worker pool.
+
+    Handlers call ``enqueue`` and move on; workers run the blocking transport
+    in threads, retry failures with jittered exponential backoff and record
+    each delivery's status. ``PRIORITY_KINDS`` jump the queue and are
+    never rejected, however full it is. A message of a ``COALESCE_KINDS`` kind joins
+    the unsent delivery of that kind, about the same user, to the same
+    number, if there is one.
+    """
+
+    def __init__(self, transport=None, workers: int = NOTIFY_WORKERS, max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+                 backoff_base: float = NOTIFY_BACKOFF_BASE, backoff_max: float = NOTIFY_BACKOFF_MAX,
+                 max_queue: int = NOTIFY_QUEUE_MAX, history: int = NOTIFY_HISTORY):
+        self.transport = transport or _default_transport()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.history = history
+        self.deliveries: OrderedDict[int, Delivery] = OrderedDict()
+        self.counts = {"sent": 0, "failed": 0, "retried": 0, "rejected": 0, "coalesced": 0}
+        self.max_queue = max_queue
+        # (priority, delivery id, delivery); unbounded, _put enforces max_queue
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._ids = itertools.count(1)
+        self._tasks: list[asyncio.Task] = []
+        self._retry_handles: set[asyncio.TimerHandle] = set()
+        # (kind, user_id, to) -> delivery queued or waiting to retry, for COALESCE_KINDS
+        self._waiting: dict[tuple[str, int | None, str], Delivery] = {}
+        # deliveries not yet sent or given up on, including ones waiting to retry
+        self._unfinished = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10):
+        """Give queued messages up to ``timeout`` seconds to go out, then stop."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            log.warning("stopping with messages unsent", unsent=self._unfinished)
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def enqueue(self, message: OutboundMessage) -> Delivery:
+        if message.kind in COALESCE_KINDS:
+            waiting = self._waiting.get(_merge_key(message))
+            if waiting is not None:
+                # not sent yet: send the newest text once instead of twice
+                waiting.message = message
+                self.counts["coalesced"] += 1
+                return waiting
+        delivery = Delivery(next(self._ids), message)
+        self._remember(delivery)
+        if not self._put(delivery):
+            self.counts["rejected"] += 1
+            delivery._set("failed", "outbox full")
+            log.warning("queue full, message dropped", kind=message.kind, to=redact_phone(message.to))
+            return delivery
+        self._unfinished += 1
+        self._idle.clear()
+        self._wait(delivery)
+        return delivery
+
+    def _put(self, delivery: Delivery) -> bool:
+        urgent = delivery.message.kind in PRIORITY_KINDS
+        if not urgent and self._queue.qsize() >= self.max_queue:
+            return False
+        self._queue.put_nowait((0 if urgent else 1, delivery.id, delivery))
+        return True
+
+    def _wait(self, delivery: Delivery):
+        if delivery.message.kind in COALESCE_KINDS:
+            self._waiting[_merge_key(delivery.message)] = delivery
+
+    def _unwait(self, delivery: Delivery):
+        key = _merge_key(delivery.message)
+        if self._waiting.get(key) is delivery:
+            del self._waiting[key]
+
+    def get(self, delivery_id: int) -> Delivery | None:
+        return self.deliveries.get(delivery_id)
+
+    async def _worker(self):
+        while True:
+            _, _, delivery = await self._queue.get()
+            await self._attempt(delivery)
+
+    async def _attempt(self, delivery: Delivery):
+        # from here on a new message needs a delivery of its own
+        self._unwait(delivery)
+        delivery.attempts += 1
+        delivery._set("sending")
+        started = time.perf_counter()
+        try:
+            delivery.sid = await asyncio.to_thread(self.transport.send, delivery.message)
+            SEND_SECONDS.observe(time.perf_counter() - started, kind=delivery.message.kind, outcome="ok")
+        except Exception as e:
+            SEND_SECONDS.observe(time.perf_counter() - started, kind=delivery.message.kind, outcome="error")
+            if delivery.attempts >= self.max_attempts:
+                self.counts["failed"] += 1
+                delivery._set("failed", str(e))
+                log.error("giving up on message", kind=delivery.message.kind, to=redact_phone(delivery.message.to),
+                          attempts=delivery.attempts, error=str(e))
+                self._finished()
+                return
+            self.counts["retried"] += 1
+            delivery._set("retrying", str(e))
+            # full jitter keeps a burst of failures from retrying in lockstep
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (delivery.attempts - 1)))
+            if _merge_key(delivery.message) not in self._waiting:
+                self._wait(delivery)
+            self._schedule_retry(delivery, delay)
+            return
+        self.counts["sent"] += 1
+        delivery._set("sent")
+        self._finished()
+
+    def _schedule_retry(self, delivery: Delivery, delay: float):
+        loop = asyncio.get_running_loop()
+
+        def requeue():
+            self._retry_handles.discard(handle)
+            if not self._put(delivery):
+                self._unwait(delivery)
+                self.counts["failed"] += 1
+                delivery._set("failed", "outbox full")
+                self._finished()
+
+        handle = loop.call_later(delay, requeue)
+        self._retry_handles.add(handle)
+
+    def _finished(self):
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._idle.set()
+
+    def _remember(self, delivery: Delivery):
+        self.deliveries[delivery.id] = delivery
+        while len(self.deliveries) > self.history:
+            self.deliveries.popitem(last=False)
+
+
+def _merge_key(message: OutboundMessage) -> tuple[str, int | None, str]:
+    return message.kind, message.user_id, message.to
+
+
+def _default_transport():
+    if NOTIFY_TRANSPORT == "fake":
+        return FakeTransport()
+    return TwilioTransport()
+
+
+outbox = NotificationOutbox()
@@ -1,35 +1,260 @@
+import argparse
 import asyncio
-import websockets
 import json
+import math
+import random
+import time
+from collections import Counter
+import httpx
+import msgpack
+import websockets
+
+# Load generator for the websocket fan-out path.
+#
+#   python test_movement.py --users 2000 --fanout 5 --rate 0.5 --duration 120
+#
+# It registers (or logs in) N users, links each one to `fanout` accepted
+# contacts, opens an authenticated socket per user and replays walking
+# movement. Every socket is both a sender and a watcher, so end-to-end
+# latency is measured in this one process with a single clock.
+# Opening thousands of sockets needs a matching `ulimit -n`. Fixes the
+# server's trajectory filter rejects count as dropped, so keep --rate below
+# 1 / TRACK_MIN_INTERVAL_S when sizing pure fan-out throughput.
 
 # starting location - Clemson University main campus near Sikes Hall
 start_lat = 34.6794
 start_lng = -82.8351
 
-async def simulate_movement():
-    async with websockets.connect('ws://127.0.0.1:8000/ws/user1') as ws:
-        print("Connected! Simulating movement across Clemson campus...")
-        
-        lat = start_lat
-        lng = start_lng
-        
-        # send 20 location updates, moving slightly each time
-        for i in range(20):
-            # move slightly to simulate walking across campus
-            lat += 0.0001
-            lng += 0.0001
-            
-            await ws.send(json.dumps({
-                "type": "location_update",
-                "lat": lat,
-                "lng": lng
-            }))
-            
-            print(f"Step {i+1}/20: Moving to {lat:.4f}, {lng:.4f}")
-            
-            # wait 2 seconds between updates to simulate real movement
-            await asyncio.sleep(2)
-        
-        print("Simulation complete!")
-
-asyncio.run(simulate_movement())
\ No newline at end of file
+# ~11 m per step, enough to clear the server's minimum-distance filter
+STEP_DEG = 0.0001
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Websocket movement load generator")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=10, help="number of users / sockets")
+    parser.add_argument("--fanout", type=int, default=3, help="accepted contacts watching each user")
+    parser.add_argument("--rate", type=float, default=0.5, help="location fixes per second per user")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of movement to replay")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which senders start")
+    parser.add_argument("--grace", type=float, default=5, help="seconds to wait for late deliveries")
+    parser.add_argument("--prefix", default="load", help="username prefix, so runs can reuse accounts")
+    parser.add_argument("--password", default="loadtest-pw")
+    parser.add_argument("--setup-concurrency", type=int, default=50, help="parallel HTTP calls during setup")
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="parallel websocket handshakes")
+    parser.add_argument("--sessions", action="store_true", help="start a tracking session on every socket")
+    parser.add_argument("--codec", choices=("json", "msgpack"), default="json", help="websocket subprotocol to request")
+    parser.add_argument("--no-deflate", action="store_true", help="don't offer permessage-deflate")
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser.parse_args()
+
+
+class Stats:
+    def __init__(self):
+        # (sender id, lat, lng) -> perf_counter at send; coordinates are unique per sender
+        self.sent_at = {}
+        self.sent = 0
+        self.expected = 0
+        self.latencies = []
+        self.unmatched = 0
+        self.http_errors = Counter()
+        self.connect_errors = Counter()
+        self.closes = Counter()
+        self.bytes_received = 0
+        self.send_errors = 0
+        # movement starts once every socket is open, so no watcher misses early fixes
+        self.go = asyncio.Event()
+        self.stop_at = 0.0
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+async def login_or_register(http, args, stats, index, limit):
+    username = f"{args.prefix}{index}"
+    email = f"{username}@example.com"
+    try:
+        async with limit:
+            r = await http.post("/auth/register", json={"username": username, "email": email, "password": args.password})
+            if r.status_code == 400:
+                # already registered by an earlier run
+                r = await http.post("/auth/login", json={"email": email, "password": args.password})
+    except httpx.HTTPError as e:
+        stats.http_errors[f"auth {type(e).__name__}"] += 1
+        return None
+    if r.status_code != 200:
+        stats.http_errors[f"auth {r.status_code}"] += 1
+        return None
+    body = r.json()
+    return {"id": body["user"]["id"], "email": email, "token": body["token"]}
+
+
+async def link_contact(http, stats, owner, watcher, limit):
+    try:
+        async with limit:
+            r = await http.post(f"/users/{owner['id']}/contacts", json={
+                "contact_user_id": watcher["id"],
+                "contact_name": watcher["email"],
+                "contact_email": watcher["email"],
+                "status": "accepted",
+            })
+    except httpx.HTTPError as e:
+        stats.http_errors[f"contacts {type(e).__name__}"] += 1
+        return
+    # 400 means the link exists from an earlier run
+    if r.status_code not in (200, 400):
+        stats.http_errors[f"contacts {r.status_code}"] += 1
+
+
+async def setup_users(args, stats):
+    limit = asyncio.Semaphore(args.setup_concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as http:
+        users = await asyncio.gather(*(login_or_register(http, args, stats, i, limit) for i in range(args.users)))
+        users = [u for u in users if u]
+        fanout = max(0, min(args.fanout, len(users) - 1))
+        # ring graph: user i is watched by the next `fanout` users
+        await asyncio.gather(*(
+            link_contact(http, stats, owner, users[(i + k) % len(users)], limit)
+            for i, owner in enumerate(users)
+            for k in range(1, fanout + 1)
+        ))
+    return users, fanout
+
+
+async def receive(ws, stats):
+    try:
+        async for raw in ws:
+            stats.bytes_received += len(raw)
+            message = msgpack.unpackb(raw) if isinstance(raw, bytes) else json.loads(raw)
+            if message.get("type") != "location_update":
+                continue
+            sent = stats.sent_at.get((message.get("id"), message.get("lat"), message.get("lng")))
+            if sent is None:
+                stats.unmatched += 1
+            else:
+                stats.latencies.append(time.perf_counter() - sent)
+    except websockets.ConnectionClosed:
+        pass
+    stats.closes[ws.close_code] += 1
+
+
+def encode(ws, message):
+    if ws.subprotocol == "safetrack.msgpack":
+        return msgpack.packb(message)
+    return json.dumps(message)
+
+
+async def move(ws, args, stats, user, index, fanout):
+    interval = 1 / args.rate
+    # spread users out so every (sender, lat, lng) is distinct
+    lat = start_lat + (index % 100) * 0.01
+    lng = start_lng + (index // 100) * 0.01
+    await asyncio.sleep(random.uniform(0, args.ramp))
+    if args.sessions:
+        await ws.send(encode(ws, {"type": "start_session"}))
+
+    while time.perf_counter() < stats.stop_at:
+        lat += STEP_DEG
+        lng += STEP_DEG * random.choice((-1, 1))
+        stats.sent_at[(user["id"], lat, lng)] = time.perf_counter()
+        try:
+            await ws.send(encode(ws, {"type": "location_update", "lat": lat, "lng": lng, "accuracy": 5}))
+        except websockets.ConnectionClosed:
+            stats.send_errors += 1
+            return
+        stats.sent += 1
+        stats.expected += fanout
+        await asyncio.sleep(interval)
+
+
+async def run_socket(args, stats, user, index, fanout, limit, started):
+    url = args.base_url.replace("http", "ws", 1) + f"/ws/{user['id']}?token={user['token']}"
+    try:
+        async with limit:
+            ws = await websockets.connect(
+                url,
+                open_timeout=30,
+                max_queue=None,
+                subprotocols=[f"safetrack.{args.codec}"],
+                compression=None if args.no_deflate else "deflate",
+            )
+    except Exception as e:
+        stats.connect_errors[type(e).__name__] += 1
+        started.release()
+        return
+    started.release()
+    async with ws:
+        reader = asyncio.create_task(receive(ws, stats))
+        await stats.go.wait()
+        await move(ws, args, stats, user, index, fanout)
+        # keep watching for deliveries still in flight
+        await asyncio.sleep(max(0, stats.stop_at + args.grace - time.perf_counter()))
+    await reader
+
+
+def report(args, stats, users, fanout, connect_s):
+    lat_ms = [x * 1000 for x in stats.latencies]
+    delivered = len(stats.latencies)
+    result = {
+        "users": len(users),
+        "fanout": fanout,
+        "rate_per_user": args.rate,
+        "codec": args.codec,
+        "deflate": not args.no_deflate,
+        "connect_seconds": round(connect_s, 2),
+        "sent": stats.sent,
+        "expected_deliveries": stats.expected,
+        "delivered": delivered,
+        # includes fixes the server filtered or conflated for a slow watcher
+        "dropped": max(0, stats.expected - delivered),
+        "drop_rate": round(1 - delivered / stats.expected, 4) if stats.expected else None,
+        "unmatched": stats.unmatched,
+        "latency_ms": {f"p{p}": round(percentile(lat_ms, p), 2) if lat_ms else None for p in (50, 90, 95, 99, 99.9)},
+        "max_latency_ms": round(max(lat_ms), 2) if lat_ms else None,
+        "deliveries_per_s": round(delivered / args.duration, 1),
+        # payload bytes after decompression; wire bytes are lower with deflate
+        "bytes_per_delivery": round(stats.bytes_received / delivered, 1) if delivered else None,
+        "http_errors": dict(stats.http_errors),
+        "connect_errors": dict(stats.connect_errors),
+        "send_errors": stats.send_errors,
+        # 1000 is a normal close; 1011/1013 are server errors or a dropped slow consumer
+        "close_codes": {str(k): v for k, v in stats.closes.items()},
+    }
+    print(json.dumps(result, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+async def simulate_movement(args):
+    stats = Stats()
+    users, fanout = await setup_users(args, stats)
+    print(f"Set up {len(users)} users with fan-out {fanout}")
+    if not users:
+        report(args, stats, users, fanout, 0)
+        return
+
+    limit = asyncio.Semaphore(args.connect_concurrency)
+    started = asyncio.Semaphore(0)
+    t0 = time.perf_counter()
+    tasks = [
+        asyncio.create_task(run_socket(args, stats, user, i, fanout, limit, started))
+        for i, user in enumerate(users)
+    ]
+    for _ in users:
+        await started.acquire()
+    connect_s = time.perf_counter() - t0
+    print(f"Opened {len(users) - sum(stats.connect_errors.values())} sockets in {connect_s:.1f}s, replaying movement...")
+    stats.stop_at = time.perf_counter() + args.ramp + args.duration
+    stats.go.set()
+
+    await asyncio.gather(*tasks)
+    report(args, stats, users, fanout, connect_s)
+
+
+if __name__ == "__main__":
+    asyncio.run(simulate_movement(parse_args()))
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import time
+from datetime import timezone
+from typing import Awaitable, Callable
+from broker import Broker
+from Database.database import AsyncSessionLocal
+from Services import locationService, metrics, session_registry, user_service
+from Services.app_logging import get_logger
+
+# Viewers allowed on one target per worker; more get a 503.
+TRACK_MAX_VIEWERS = int(os.getenv("TRACK_MAX_VIEWERS", "1000"))
+# How long a target with no viewers keeps its subscription, so reconnects
+# and long-poll clients between requests don't reload the snapshot.
+TRACK_LINGER_S = float(os.getenv("TRACK_LINGER_S", "30"))
+
+TRACK_PREFIX = "track:"
+
+log = get_logger("track")
+
+Loader = Callable[[int], Awaitable[dict]]
+
+
+def track_channel(user_id: int) -> str:
+    return f"{TRACK_PREFIX}{user_id}"
+
+
+class Target:
+    """Live state of one tracked user, shared by all of its link viewers.
+
+    Every change bumps ``version`` and re-serializes the state once into
+    ``data``; viewers only compare versions and write the shared bytes, so
+    a slow viewer skips straight to the newest state.
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.viewers = 0
+        self.version = 0
+        self.state = {
+            "user_id": user_id,
+            "name": None,
+            "sharing": False,
+            "emergency": False,
+            "lat": None,
+            "lng": None,
+            "updated_at": None,
+        }
+        self.data = ""
+        self.frame = b""
+        self.loaded: asyncio.Future | None = None
+        self._changed = asyncio.Event()
+        self._expiry: asyncio.TimerHandle | None = None
+
+    def update(self, **fields):
+        self.state.update(fields)
+        self.version += 1
+        self.state["version"] = self.version
+        self.data = json.dumps(self.state, separators=(",", ":"))
+        self.frame = f"id: {self.version}\nevent: state\ndata: {self.data}\n\n".encode()
+        # wake everyone waiting on the old event; later waiters get a fresh one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self, seen: int, timeout: float) -> bool:
+        """Wait until ``version`` differs from ``seen``. False on timeout."""
+        if self.version != seen:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class TrackHub:
+    """Per-target fan-out for the public tracking feed.
+
+    The first viewer of a target subscribes this worker to the target's
+    broker channel and loads a snapshot; every later viewer shares both, so
+    a hundred viewers cost one subscription and one database read.
+    """
+
+    def __init__(self, loader: Loader):
+        self.loader = loader
+        self.broker: Broker | None = None
+        self._targets: dict[int, Target] = {}
+
+    def attach(self, broker: Broker):
+        """Route through ``broker``, re-subscribing every live target."""
+        self.broker = broker
+        for user_id in self._targets:
+            broker.subscribe(track_channel(user_id))
+
+    def full(self, user_id: int) -> bool:
+        target = self._targets.get(user_id)
+        return target is not None and target.viewers >= TRACK_MAX_VIEWERS
+
+    async def join(self, user_id: int) -> Target:
+        target = self._targets.get(user_id)
+        if target is None:
+            target = self._targets[user_id] = Target(user_id)
+            # subscribe before loading, so no update falls between snapshot and feed
+            self.broker.subscribe(track_channel(user_id))
+            target.loaded = asyncio.ensure_future(self._load(target))
+        if target._expiry is not None:
+            target._expiry.cancel()
+            target._expiry = None
+        target.viewers += 1
+        try:
+            await asyncio.shield(target.loaded)
+        except BaseException:
+            self.leave(target)
+            raise
+        return target
+
+    def leave(self, target: Target):
+        target.viewers -= 1
+        if target.viewers == 0 and target._expiry is None:
+            target._expiry = asyncio.get_running_loop().call_later(TRACK_LINGER_S, self._expire, target)
+
+    def _expire(self, target: Target):
+        target._expiry = None
+        if target.viewers == 0 and self._targets.get(target.user_id) is target:
+            del self._targets[target.user_id]
+            self.broker.unsubscribe(track_channel(target.user_id))
+
+    async def _load(self, target: Target):
+        try:
+            snapshot = await self.loader(target.user_id)
+        except Exception as e:
+            # viewers still get live updates, just no starting point
+            log.warning("snapshot failed", user_id=target.user_id, error=str(e))
+            snapshot = {}
+        if target.version:
+            # live updates arrived while loading; they are newer than the snapshot
+            snapshot = {"name": snapshot.get("name")}
+        target.update(**snapshot)
+
+    def deliver(self, channel: str, message: dict):
+        target = self._targets.get(int(channel[len(TRACK_PREFIX):]))
+        if target is None:
+            return
+        now = int(time.time() * 1000)
+        kind = message.get("type")
+        if kind == "location_update":
+            # replayed batches carry the phone's own time for their newest point
+            target.update(sharing=True, lat=message.get("lat"), lng=message.get("lng"),
+                          updated_at=message.get("timestamp") or now)
+        elif kind == "contact_started":
+            target.update(sharing=True)
+        elif kind == "contact_ended":
+            target.update(sharing=False, emergency=False)
+        elif kind == "emergency_alert":
+            fields = {"emergency": True}
+            if message.get("lat") is not None and message.get("lng") is not None:
+                fields.update(lat=message["lat"], lng=message["lng"], updated_at=now)
+            target.update(**fields)
+
+    def stats(self) -> dict:
+        return {
+            "targets": len(self._targets),
+            "viewers": sum(t.viewers for t in self._targets.values()),
+        }
+
+
+async def _load_snapshot(user_id: int) -> dict:
+    """Name, sharing status and last stored point of a user."""
+    async with AsyncSessionLocal() as db:
+        user = await user_service.get_user_async(db, user_id)
+        session_id = await session_registry.lookup_async(db, user_id)
+        latest = await locationService.get_latest_location_async(db, session_id) if session_id else None
+
+    snapshot = {"name": user.username if user else None, "sharing": session_id is not None}
+    if latest is not None:
+        ts = latest.timestamp
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        snapshot.update(lat=float(latest.latitude), lng=float(latest.longitude), updated_at=int(ts.timestamp() * 1000))
+    return snapshot
+
+
+track_hub = TrackHub(_load_snapshot)
+
+metrics.stats_gauges("track", "Public tracking feed", track_hub.stats)
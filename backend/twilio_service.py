@@ -1,10 +1,15 @@
 from twilio.rest import Client
 from dotenv import load_dotenv
+from typing import NamedTuple
 import os
+from Services.app_logging import get_logger, redact_phone
+from Services.auth_service import create_share_token
 
 # loads environemnt variables
 load_dotenv()
 
+log = get_logger("twilio")
+
 # Load Twilio credentials
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
@@ -14,41 +19,78 @@ twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
 SERVER_URL = os.getenv("SERVER_URL")
 
-def send_emergency_sms(to_number: str, user_name: str, lat: float, lng: float, user_id: str):
-    tracking_link = f"{SERVER_URL}/track/{user_id}"
 
-    try:
-        message = twilio_client.messages.create(
-            body=(
-                f"🚨 EMERGENCY ALERT\n"
-                f"{user_name} has triggered an emergency alert.\n\n"
-                f"Track their live location here:\n"
-                f"{tracking_link}\n\n"
-            ),
-            from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
-            to=f"whatsapp:{to_number}"
+def tracking_link(user_id: int) -> str:
+    """Public tracking page for ``user_id``, with a share token that only allows watching."""
+    return f"{SERVER_URL}/track/{user_id}?token={create_share_token(user_id)}"
+
+
+class OutboundMessage(NamedTuple):
+    kind: str
+    to: str
+    from_: str
+    body: str
+    # user the message is about, e.g. who raised the alert
+    user_id: int | None = None
+
+
+def emergency_message(to_number: str, user_name: str, user_id: int) -> OutboundMessage:
+    link = tracking_link(user_id)
+    return OutboundMessage(
+        kind="emergency",
+        body=(
+            f"🚨 EMERGENCY ALERT\n"
+            f"{user_name} has triggered an emergency alert.\n\n"
+            f"Track their live location here:\n"
+            f"{link}\n\n"
+        ),
+        from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
+        to=f"whatsapp:{to_number}",
+        user_id=user_id,
+    )
+
+
+def location_share_message(to_number: str, user_name: str, user_id: int) -> OutboundMessage:
+    """SMS with live location link to a contact when sharing starts"""
+    link = tracking_link(user_id)
+    return OutboundMessage(
+        kind="location_share",
+        body=(
+            f"📍 {user_name} is sharing their live location with you.\n"
+            f"Click to track: {link}"
+        ),
+        from_=TWILIO_PHONE_NUMBER,
+        to=to_number
+    )
+
+
+class TwilioTransport:
+    """Sends through the Twilio REST API. Blocking; run it off the event loop."""
+
+    def send(self, message: OutboundMessage) -> str:
+        result = twilio_client.messages.create(
+            body=message.body,
+            from_=message.from_,
+            to=message.to
         )
-        print(f"WhatsApp message sent successfully! SID: {message.sid}")
-        return message.sid
+        return result.sid
+
+
+def send_emergency_sms(to_number: str, user_name: str, lat: float, lng: float, user_id: str):
+    try:
+        sid = TwilioTransport().send(emergency_message(to_number, user_name, user_id))
+        log.info("emergency message sent", to=redact_phone(to_number), sid=sid)
+        return sid
     except Exception as e:
-        print(f"Error sending WhatsApp Message: {e}")
+        log.error("emergency message failed", to=redact_phone(to_number), error=str(e))
         return None
 
 
 def send_location_share_sms(to_number: str, user_name: str, user_id: int):
     """Send SMS with live location link to a contact when sharing starts"""
-    tracking_link = f"{SERVER_URL}/track/{user_id}"
-    
     try:
-        message = twilio_client.messages.create(
-            body=(
-                f"📍 {user_name} is sharing their live location with you.\n"
-                f"Click to track: {tracking_link}"
-            ),
-            from_=TWILIO_PHONE_NUMBER,
-            to=to_number
-        )
-        print(f"[Twilio] Location share SMS sent to {to_number}! SID: {message.sid}")
-        return message.sid
+        sid = TwilioTransport().send(location_share_message(to_number, user_name, user_id))
+        log.info("location share sent", to=redact_phone(to_number), sid=sid)
+        return sid
     except Exception as e:
-        print(f"[Twilio] Error sending SMS to {to_number}: {e}")
+        log.error("location share failed", to=redact_phone(to_number), error=str(e))
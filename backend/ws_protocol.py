@@ -0,0 +1,72 @@
+import json
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # the binary subprotocol is simply not offered
+    msgpack = None
+
+# Wire formats for /ws. JSON text frames are the default; a client that
+# offers the msgpack subprotocol in Sec-WebSocket-Protocol gets binary
+# MessagePack frames with the same fields instead, in both directions.
+#
+#   new WebSocket(url, ["safetrack.msgpack", "safetrack.json"])
+#
+# permessage-deflate is negotiated separately by the server (uvicorn's
+# ws_per_message_deflate) and works with either format.
+
+JSON = "safetrack.json"
+MSGPACK = "safetrack.msgpack"
+
+
+def available() -> list[str]:
+    return [MSGPACK, JSON] if msgpack is not None else [JSON]
+
+
+def negotiate(websocket: WebSocket) -> tuple[str, str | None]:
+    """Codec for this connection and the subprotocol to echo in the handshake.
+
+    The first offered protocol we support wins; no offer means plain JSON
+    and no Sec-WebSocket-Protocol header, as before.
+    """
+    supported = available()
+    for offered in websocket.scope.get("subprotocols") or ():
+        if offered in supported:
+            return offered, offered
+    return JSON, None
+
+
+class Frame:
+    """An outbound message plus its encodings, each made at most once.
+
+    The same Frame is queued on every recipient's connection, so a fan-out
+    to N watchers serializes once per codec in use rather than N times.
+    """
+    __slots__ = ("message", "_json", "_msgpack")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self._json: str | None = None
+        self._msgpack: bytes | None = None
+
+    def encode(self, codec: str) -> str | bytes:
+        if codec == MSGPACK:
+            if self._msgpack is None:
+                self._msgpack = msgpack.packb(self.message)
+            return self._msgpack
+        if self._json is None:
+            # same output as starlette's send_json
+            self._json = json.dumps(self.message, separators=(",", ":"), ensure_ascii=False)
+        return self._json
+
+
+async def receive(websocket: WebSocket, codec: str) -> dict:
+    """Next inbound message, decoded by frame type: binary is MessagePack, text is JSON."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    if message.get("bytes") is not None:
+        if codec != MSGPACK:
+            raise ValueError("binary frame on a JSON connection")
+        return msgpack.unpackb(message["bytes"])
+    return json.loads(message["text"])